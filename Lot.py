@@ -1,14 +1,18 @@
 '''Lot: type at pt st'''
+import operator
+
+import numpy as np
 
 
 class Lot():
 
-    def __init__(self, idx, ltype, arrivet, processt, startt=-1):
+    def __init__(self, idx, ltype, arrivet, processt, startt=-1, machine=None):
         self.idx = idx
         self.ltype = ltype
         self.arrivet = arrivet
         self.processt = processt
         self.startt = startt
+        self.machine = machine  # assigned machine in the parallel-machine models
 
     def gettype(self):
         return self.ltype
@@ -16,3 +20,159 @@ class Lot():
     def __repr__(self):
         return 'Lot: {},Type: {},arrive at {}, process {} mins.'.format(self.idx, self.ltype,
                                                                         self.processt, self.arrivet)
+
+
+class Operation():
+    """alternatives: {machine: processing time} of the machines that can run the operation."""
+
+    def __init__(self, job, index, alternatives):
+        self.job = job
+        self.index = index
+        self.alternatives = alternatives
+        self.startt = -1
+        self.machine = None
+
+    def __repr__(self):
+        return 'Operation {}-{} on {}'.format(self.job, self.index, self.alternatives)
+
+
+class Job(Lot):
+    """A lot processed by an ordered list of operations; processt is the shortest total processing."""
+
+    def __init__(self, idx, ltype, arrivet, operations):
+        super().__init__(idx, ltype, arrivet, sum(min(op.alternatives.values()) for op in operations))
+        self.operations = operations
+
+
+def column_property(name):
+    def get(self):
+        return int(getattr(self.table, name)[self.row])
+
+    def set(self, value):
+        # operator.index rejects floats instead of truncating them into the int64 column
+        getattr(self.table, name)[self.row] = operator.index(value)
+
+    return property(get, set)
+
+
+class LotView():
+    """Lot interface over one row of a LotTable; reads and writes go to the table columns. An attribute
+    read costs several times a plain Lot attribute, so loops over many lots should read the columns
+    through lot_arrays / lot_column instead."""
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    idx = column_property('idx')
+    ltype = column_property('ltype')
+    arrivet = column_property('arrivet')
+    processt = column_property('processt')
+    startt = column_property('startt')
+
+    @property
+    def machine(self):
+        k = int(self.table.machine[self.row])
+        return None if k < 0 else k
+
+    @machine.setter
+    def machine(self, value):
+        self.table.machine[self.row] = -1 if value is None else value
+
+    def gettype(self):
+        return self.ltype
+
+    def __copy__(self):
+        # a detached Lot, changing the copy must not change the table
+        return Lot(self.idx, self.ltype, self.arrivet, self.processt, self.startt, self.machine)
+
+    def __repr__(self):
+        return 'Lot: {},Type: {},arrive at {}, process {} mins.'.format(self.idx, self.ltype,
+                                                                        self.arrivet, self.processt)
+
+
+class LotTable():
+    """Lots as contiguous int64 columns, one row per lot; startt and machine are -1 until scheduled.
+    to_lots() gives LotView objects over the columns, from_lots() of such a list gives the table back
+    without copying."""
+
+    columns = ('idx', 'ltype', 'arrivet', 'processt', 'startt', 'machine')
+
+    def __init__(self, arrivet, processt, ltype, idx=None, startt=None, machine=None):
+        self.arrivet = np.ascontiguousarray(arrivet, dtype=np.int64)
+        nlot = len(self.arrivet)
+        self.processt = np.ascontiguousarray(processt, dtype=np.int64)
+        self.ltype = np.ascontiguousarray(ltype, dtype=np.int64)
+        self.idx = np.arange(nlot, dtype=np.int64) if idx is None else np.ascontiguousarray(idx, dtype=np.int64)
+        self.startt = np.full(nlot, -1, dtype=np.int64) if startt is None else \
+            np.ascontiguousarray(startt, dtype=np.int64)
+        self.machine = np.full(nlot, -1, dtype=np.int64) if machine is None else \
+            np.ascontiguousarray(machine, dtype=np.int64)
+
+    @classmethod
+    def from_lots(cls, lots):
+        """The table behind lots if they are its views in row order, else a new table with their values."""
+        if isinstance(lots, LotTable):
+            return lots
+        found = table_rows(lots)
+        if found is not None:
+            table, rows = found
+            if len(rows) == len(table) and (rows == np.arange(len(table))).all():
+                return table
+            return table.take(rows)
+        return cls(arrivet=[lot.arrivet for lot in lots],
+                   processt=[lot.processt for lot in lots],
+                   ltype=[lot.ltype for lot in lots],
+                   idx=[lot.idx for lot in lots],
+                   startt=[lot.startt for lot in lots],
+                   machine=[-1 if getattr(lot, 'machine', None) is None else lot.machine for lot in lots])
+
+    def take(self, rows):
+        """New table of the given rows, in that order."""
+        return LotTable(**{name: getattr(self, name)[rows] for name in self.columns})
+
+    def to_lots(self):
+        return [LotView(self, row) for row in range(len(self))]
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.columns)
+
+    def __len__(self):
+        return len(self.arrivet)
+
+    def __getitem__(self, row):
+        return LotView(self, row)
+
+    def __iter__(self):
+        return (LotView(self, row) for row in range(len(self)))
+
+
+def table_rows(lots):
+    """(table, rows) if every lot is a view of one LotTable, else None."""
+    if not lots or type(lots[0]) is not LotView:
+        return None
+    table = lots[0].table
+    if not all(type(lot) is LotView and lot.table is table for lot in lots):
+        return None
+    return table, np.fromiter((lot.row for lot in lots), dtype=np.int64, count=len(lots))
+
+
+def lot_column(lots, name, dtype=np.int64):
+    """One attribute of lots as an array in list order, without copying when lots are the views of one
+    LotTable in row order. The array must not be written to."""
+    if isinstance(lots, LotTable):
+        return getattr(lots, name)
+    found = table_rows(lots)
+    if found is not None:
+        table, rows = found
+        if len(rows) == len(table) and (rows == np.arange(len(table))).all():
+            return getattr(table, name)
+        return getattr(table, name)[rows]
+    return np.fromiter((getattr(lot, name) for lot in lots), dtype=dtype, count=len(lots))
+
+
+def lot_arrays(lots):
+    """Return arrive, process and type of lots as int64 arrays in list order, see lot_column."""
+    return lot_column(lots, 'arrivet'), lot_column(lots, 'processt'), lot_column(lots, 'ltype')
@@ -0,0 +1,198 @@
+"""Reproducible benchmark: seeded instance families, one command, comparison against a stored baseline.
+
+    python benchmark.py --out data/bench.json                       # run and save the results
+    python benchmark.py --baseline data/bench_baseline.json         # run and compare, exit 1 on regressions
+    python benchmark.py --engines heuristic --sizes 1000 10000 --seeds 0 1 2
+    python benchmark.py --startup                                   # cold start of a CP solve, exit 1 over budget
+
+Every (family, size, seed) gives the same instance on every machine. For every engine the benchmark
+records build time, time to the first feasible solution (the final solve time for engines without an
+incumbent callback), objective, bound, gap and status. Exact engines skip sizes above MAX_SIZE.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from Lot import Lot
+from engines import get_engine
+from solve_trace import traced_solve
+
+# arrival: arrivals are drawn from [0, arrival * nlot), with processt in [5, 11) a value below 7.5
+# keeps the machine overloaded (tight), above it mostly idle (loose)
+FAMILIES = {
+    'tight-few': {'arrival': 4, 'ntype': 3, 'symmetric': True},
+    'tight-many': {'arrival': 4, 'ntype': 20, 'symmetric': True},
+    'loose-few': {'arrival': 12, 'ntype': 3, 'symmetric': True},
+    'loose-many': {'arrival': 12, 'ntype': 20, 'symmetric': True},
+    'asym-tight': {'arrival': 4, 'ntype': 8, 'symmetric': False},
+    'asym-loose': {'arrival': 12, 'ntype': 8, 'symmetric': False},
+}
+SIZES = (10, 50, 100, 500, 1000, 10000)
+SEEDS = (0, 1, 2)
+MAX_SIZE = {'cp': 300, 'lp': 100, 'copt': 300, 'heuristic': 10000}
+FAST_BUILD = ('cp', 'lp')
+
+# [s] a fresh interpreter that imports, builds and solves a small CP instance may take this much
+# longer than one that only imports CP-SAT, which is most of the cold start and depends on the machine
+STARTUP_BUDGET = 0.3
+STARTUP_BASELINE = 'from ortools.sat.python import cp_model'
+STARTUP_SCRIPT = """
+import sys
+import single_machine_setup_cp as cp
+mdl = cp.SingleSetupOrtoolsCP(cp.create_lots_from_tuplelist(cp.lot_data), cp.type_transform_matrix)
+mdl.build_model()
+mdl.set_num_workers(1)
+mdl.solve()
+heavy = [name for name in ('matplotlib', 'coptpy', 'xlrd', 'xlwt') if name in sys.modules]
+if heavy:
+    sys.exit('imported at startup: ' + ', '.join(heavy))
+"""
+
+
+def make_instance(family, size, seed):
+    """Lots and setup matrix of one instance of family, the same for the same (family, size, seed)."""
+    params = FAMILIES[family]
+    rng = np.random.default_rng([seed, size, zlib.crc32(family.encode())])
+    ntype = min(params['ntype'], size)
+
+    ttmatrix = rng.integers(1, 9, size=(ntype, ntype))
+    if params['symmetric']:
+        ttmatrix = np.triu(ttmatrix, 1)
+        ttmatrix = ttmatrix + ttmatrix.T
+    np.fill_diagonal(ttmatrix, 0)
+
+    arrivet = rng.integers(0, params['arrival'] * size, size=size)
+    processt = rng.integers(5, 11, size=size)
+    ltype = rng.integers(0, ntype, size=size)
+    lots = [Lot(idx=i, arrivet=a, processt=p, ltype=k)
+            for i, (a, p, k) in enumerate(zip(arrivet.tolist(), processt.tolist(), ltype.tolist()))]
+    return lots, ttmatrix.tolist()
+
+
+def run_case(engine, family, size, seed, time_limit, fast=False):
+    lots, ttmatrix = make_instance(family, size, seed)
+    kwargs = {'fast': True} if fast and engine in FAST_BUILD else {}
+    mdl = get_engine(engine)(lots, ttmatrix, **kwargs)
+
+    start = time.perf_counter()
+    mdl.build_model()
+    build_time = time.perf_counter() - start
+    mdl.set_solve_time(time_limit)
+    if hasattr(mdl, 'set_num_workers'):
+        mdl.set_num_workers(1)
+    if hasattr(mdl, 'set_random_seed'):
+        mdl.set_random_seed(seed)
+    trace = traced_solve(mdl, engine, '%s/%i/%i' % (family, size, seed))
+
+    return {'engine': engine, 'family': family, 'size': size, 'seed': seed,
+            'build_time': build_time,
+            'first_time': trace.rows[0][0] if trace.rows else None,
+            'solve_time': mdl.get_solve_time(),
+            'objv': mdl.get_objective_value(),
+            'bound': mdl.get_lower_bound(),
+            'gap': mdl.get_gap(),
+            'status': mdl.get_solve_status()}
+
+
+def case_key(r):
+    return r['engine'], r['family'], r['size'], r['seed']
+
+
+def run_benchmark(engines, families=tuple(FAMILIES), sizes=SIZES, seeds=SEEDS, time_limit=10, fast=False):
+    results = []
+    for engine in engines:
+        for family in families:
+            for size in sizes:
+                if size > MAX_SIZE.get(engine, 0):
+                    continue
+                for seed in seeds:
+                    r = run_case(engine, family, size, seed, time_limit, fast)
+                    results.append(r)
+                    print('%-10s %-11s %6i %3i  build %7.3fs  first %s  objv %s  gap %s  %s' % (
+                        engine, family, size, seed, r['build_time'], format_value(r['first_time'], '%.3fs'),
+                        format_value(r['objv'], '%g'), format_value(r['gap'], '%.2f%%', 100), r['status']))
+    return results
+
+
+def format_value(value, fmt, scale=1):
+    return '-' if value is None else fmt % (value * scale)
+
+
+def compare(results, baseline, obj_tol=0.01, time_tol=0.25, time_slack=0.05):
+    """Return regression messages: a worse objective than obj_tol relative, build or first-solution
+    time above (1 + time_tol) * baseline + time_slack seconds, or a lost OPTIMAL status."""
+    base = {case_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(case_key(r))
+        if b is None:
+            continue
+        name = '%s %s size %i seed %i' % case_key(r)
+        if b['objv'] is not None and (r['objv'] is None or r['objv'] > b['objv'] * (1 + obj_tol)):
+            regressions.append('%s: objv %s > baseline %s' % (name, r['objv'], b['objv']))
+        for field in ('build_time', 'first_time'):
+            if b[field] is not None and r[field] is not None and r[field] > b[field] * (1 + time_tol) + time_slack:
+                regressions.append('%s: %s %.3fs > baseline %.3fs' % (name, field, r[field], b[field]))
+        if b['status'] == 'OPTIMAL' and r['status'] != 'OPTIMAL':
+            regressions.append('%s: status %s, baseline OPTIMAL' % (name, r['status']))
+    return regressions
+
+
+def measure_startup(script=STARTUP_SCRIPT, repeat=3):
+    """Best wall time of script in a new interpreter over repeat runs."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', script], check=True, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def save_results(path, results, **meta):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--engines', nargs='+', default=['cp', 'lp', 'heuristic'])
+    parser.add_argument('--families', nargs='+', default=list(FAMILIES), choices=list(FAMILIES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--seeds', nargs='+', type=int, default=list(SEEDS))
+    parser.add_argument('--time-limit', type=float, default=10)
+    parser.add_argument('--fast', action='store_true', help='fast model build for %s' % ', '.join(FAST_BUILD))
+    parser.add_argument('--out', help='save the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results in this JSON file')
+    parser.add_argument('--startup', action='store_true',
+                        help='only measure the cold start against the CP-SAT import plus --startup-budget')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET,
+                        help='[s] allowed cold start over the bare CP-SAT import')
+    args = parser.parse_args()
+
+    if args.startup:
+        baseline = measure_startup(STARTUP_BASELINE)
+        startup = measure_startup()
+        print('cold start %.3fs, CP-SAT import %.3fs, overhead %.3fs, budget %.3fs'
+              % (startup, baseline, startup - baseline, args.startup_budget))
+        sys.exit(1 if startup - baseline > args.startup_budget else 0)
+
+    bench = run_benchmark(args.engines, args.families, args.sizes, args.seeds, args.time_limit, args.fast)
+    if args.out:
+        save_results(args.out, bench, time_limit=args.time_limit, fast=args.fast)
+    if args.baseline:
+        found = compare(bench, load_results(args.baseline))
+        for message in found:
+            print('REGRESSION ' + message)
+        print('%i cases, %i regressions against %s' % (len(bench), len(found), args.baseline))
+        sys.exit(1 if found else 0)
@@ -0,0 +1,72 @@
+"""Horizon, start-time domains and big-M values derived from the instance, shared by the CP and MIP models."""
+import numpy as np
+
+from Lot import lot_arrays
+from schedule_check import check_schedule
+
+
+def pairwise_setup(ltype, ttmatrix):
+    """setup[i][j] = ttmatrix[type of i][type of j] for every lot pair."""
+    tt = np.asarray(ttmatrix, dtype=np.int64)
+    return tt[ltype[:, None], ltype[None, :]]
+
+
+class InstanceBounds:
+    """Processing all lots grouped by type, starting once the last lot is released, is feasible and
+    needs at most one setup per type change, so the optimal makespan is at most
+
+        horizon = max release + sum processt + (number of types - 1) * max setup
+
+    (or the makespan of a known schedule, if smaller). Lot i then starts in [release_i, horizon - p_i],
+    and t_i + p_i + s_ij <= t_j + M_ij (1 - x_ij) holds for every x_ij with
+    M_ij = horizon + s_ij - release_j.
+    """
+
+    def __init__(self, lots, ttmatrix, earliest=None, upper_bound=None):
+        self.arrivet, self.processt, self.ltype = lot_arrays(lots)
+        self.ttmatrix = ttmatrix
+        self.nlot = len(lots)
+
+        release = self.arrivet
+        if earliest is not None:
+            release = np.maximum(release, np.asarray(earliest, dtype=np.int64))
+        self.release = release
+        self.horizon = self.calculate_horizon()
+        if upper_bound is not None:
+            self.horizon = min(self.horizon, int(np.ceil(upper_bound)))
+
+    def calculate_horizon(self):
+        if self.nlot == 0:
+            return 0
+        types = np.unique(self.ltype)
+        smax = int(np.asarray(self.ttmatrix, dtype=np.int64)[np.ix_(types, types)].max())
+        return int(self.release.max() + self.processt.sum() + (len(types) - 1) * smax)
+
+    def start_lb(self):
+        return self.release.tolist()
+
+    def start_ub(self):
+        return (self.horizon - self.processt).tolist()
+
+    def bigm(self):
+        """n x n array of the big-M of x_ij in the pairwise MIP constraints."""
+        return self.horizon + pairwise_setup(self.ltype, self.ttmatrix) - self.release[None, :]
+
+
+def schedule_makespan(lots, schedule):
+    """Makespan of {lot idx: start time}, a valid upper bound for the horizon if the schedule is feasible."""
+    return max(schedule[lot.idx] + lot.processt for lot in lots)
+
+
+def feasible_makespan(lots, ttmatrix, schedule, earliest=None):
+    """Makespan of {lot idx: start time} if it passes check_schedule with the pairwise setups and
+    the earliest starts, else None: a warm start that is only a hint must not cut the horizon."""
+    if not lots:
+        return None
+    arrivet, processt, ltype = lot_arrays(lots)
+    if earliest is not None:
+        arrivet = np.maximum(arrivet, np.asarray(earliest, dtype=np.int64))
+    startt = np.array([schedule[lot.idx] for lot in lots], dtype=np.float64)
+    if not check_schedule(arrivet, processt, ltype, startt, ttmatrix)['feasible']:
+        return None
+    return schedule_makespan(lots, schedule)
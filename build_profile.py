@@ -0,0 +1,32 @@
+"""Wall time per model-build phase and the size of the built model."""
+import time
+from contextlib import contextmanager
+
+
+class BuildProfile:
+
+    def __init__(self):
+        self.phases = {}  # phase name -> seconds, in build order
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        return dict(self.phases, total=self.total(), **self.counts)
+
+    def print_profile(self):
+        print('Build profile')
+        for name, seconds in self.phases.items():
+            print('  - %-12s: %8.3f s' % (name, seconds))
+        print('  - %-12s: %8.3f s' % ('total', self.total()))
+        for name, count in self.counts.items():
+            print('  - %-12s: %8i' % (name, count))
@@ -1,13 +1,33 @@
-import xlwt
+"""Generate seeded instances: the instance files data/N.xls and data/N.npz, or many instances at once.
+
+    python data_generator.py                                   # the sweep 2..9, 10..90, 100..500
+    python data_generator.py --sizes 20 50 --gantt-dir data/gantt
+    python data_generator.py --sizes 10000 --count 2000 --out data/stress --processes 4
+
+Every array of an instance is drawn in one call from np.random.default_rng([seed, nlot]), so the same
+(nlot, seed) gives the same instance everywhere. An instance is kept when its arrival-order schedule
+passes schedule_check; a single machine without deadlines always has one, the check guards the
+generated arrays themselves (negative or out-of-range values) for the solvers downstream.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import copy
 
-from Lot import Lot
-import single_machine_setup_cp as cp
+from Lot import LotTable
+from instance_io import save_npz
+from schedule_check import check_schedule, repair_schedule
+
+SIZES = list(range(2, 10)) + list(range(10, 100, 10)) + list(range(100, 501, 50))
+CHUNKSIZE = 16  # instances per task sent to a pool worker
 
 
-def write_to_xls(lots, ttmatrix):
-    lots.sort(key=lambda lot: lot.idx)
+def write_to_xls(lots, ttmatrix, path=None):
+    import xlwt
+
+    table = LotTable.from_lots(lots)
     work_book = xlwt.Workbook()
     worksheet_data = work_book.add_sheet('lot_data')
 
@@ -17,61 +37,113 @@ def write_to_xls(lots, ttmatrix):
     worksheet_data.write(0, 2, 'process_time')
     worksheet_data.write(0, 3, 'type')
 
-    for idx, lot in enumerate(lots):
-        worksheet_data.write(idx + 1, 0, lot.idx)
-        worksheet_data.write(idx + 1, 1, lot.arrivet)
-        worksheet_data.write(idx + 1, 2, lot.processt)
-        worksheet_data.write(idx + 1, 3, lot.ltype)
+    for row, i in enumerate(np.argsort(table.idx, kind='stable').tolist(), 1):
+        worksheet_data.write(row, 0, int(table.idx[i]))
+        worksheet_data.write(row, 1, int(table.arrivet[i]))
+        worksheet_data.write(row, 2, int(table.processt[i]))
+        worksheet_data.write(row, 3, int(table.ltype[i]))
 
     # write setup time for type transformation
     worksheet_setup_matrix = work_book.add_sheet('setup_matrix')
     for i in range(len(ttmatrix)):
         for j in range(len(ttmatrix[0])):
-            worksheet_setup_matrix.write(i, j, ttmatrix[i][j])
+            worksheet_setup_matrix.write(i, j, int(ttmatrix[i][j]))
 
     # save excel
-    work_book.save('data/%i.xls' % len(lots))
-
-
-def generate_data(nlot):
-    ntype = min(int(nlot / 3), 10)
-    if ntype <= 1:
-        ntype = 3
-
-    lots = []
-    ttmatrix = np.zeros((ntype, ntype))
-
-    # set type transformation matrix
-    for i in range(ntype):
-        for j in range(i + 1, ntype):
-            ttmatrix[i][j] = np.random.randint(1, 5)
-            ttmatrix[j][i] = ttmatrix[i][j]
-
-    # random generate lot
-    for i in range(nlot):
-        lot = Lot(idx=i,
-                  ltype=np.random.randint(ntype),
-                  arrivet=np.random.randint(0, nlot * 6),
-                  processt=np.random.randint(5, 11)
-                  )
-        lots.append(lot)
-
-    cpmdl = cp.SingleSetupOrtoolsCP(lots, ttmatrix)
-    cpmdl.build_model()
-    cpmdl.solve()
-    cpmdl.print_status_result_statistics()
-    cpmdl.show_gantt_chart()
-    if cpmdl.has_solution():
-        write_to_xls(lots, ttmatrix)
+    work_book.save(path or 'data/%i.xls' % len(table))
+
+
+def write_to_npz(lots, ttmatrix, path=None):
+    save_npz(path or 'data/%i.npz' % len(lots), lots, ttmatrix)
+
+
+def make_instance(nlot, seed=None, ntype=None):
+    """LotTable and symmetric setup matrix with zero diagonal: setups in [1, 5), arrivals in
+    [0, 6 * nlot), processing in [5, 11); ntype = min(nlot / 3, 10), at least 3, if None."""
+    if ntype is None:
+        ntype = min(int(nlot / 3), 10)
+        if ntype <= 1:
+            ntype = 3
+    rng = np.random.default_rng(None if seed is None else [seed, nlot])
+
+    ttmatrix = np.triu(rng.integers(1, 5, size=(ntype, ntype)), 1)
+    ttmatrix = ttmatrix + ttmatrix.T
+    table = LotTable(arrivet=rng.integers(0, nlot * 6, size=nlot),
+                     processt=rng.integers(5, 11, size=nlot),
+                     ltype=rng.integers(0, ntype, size=nlot))
+    return table, ttmatrix
+
+
+def constructive_schedule(table, ttmatrix):
+    """Arrival-order schedule of table, stored in table.startt; return its makespan, None if the
+    schedule fails the feasibility check."""
+    startt = repair_schedule(table.arrivet, table.processt, table.ltype, table.arrivet, ttmatrix)
+    if not check_schedule(table.arrivet, table.processt, table.ltype, startt, ttmatrix)['feasible']:
+        return None
+    table.startt[:] = startt
+    return int((startt + table.processt).max()) if len(table) else 0
+
+
+def generate_data(nlot, gantt_dir=None, seed=None):
+    """Draw an instance of nlot lots, write data/N.xls and data/N.npz and return the table, the
+    setup matrix and the arrival-order makespan."""
+    table, ttmatrix = make_instance(nlot, seed)
+    makespan = constructive_schedule(table, ttmatrix)
+    if makespan is None:
+        raise ValueError('Instance of %i lots (seed %s) has no feasible arrival-order schedule' % (nlot, seed))
+
+    if gantt_dir is not None:
+        from graph import save_gantt
+
+        os.makedirs(gantt_dir, exist_ok=True)
+        save_gantt(table.to_lots(), [ttmatrix], os.path.join(gantt_dir, '%i.png' % nlot))
+    write_to_xls(table, ttmatrix)
+    write_to_npz(table, ttmatrix)
+    return table, ttmatrix, makespan
+
+
+def generate_one(args):
+    """Pool task: (nlot, seed, out_dir) -> (nlot, seed, makespan or None), the instance written to
+    out_dir/N_seed.npz when it is feasible and out_dir is set."""
+    nlot, seed, out_dir = args
+    table, ttmatrix = make_instance(nlot, seed)
+    makespan = constructive_schedule(table, ttmatrix)
+    if makespan is not None and out_dir is not None:
+        save_npz(os.path.join(out_dir, '%i_%i.npz' % (nlot, seed)), table, ttmatrix)
+    return nlot, seed, makespan
+
+
+def generate_many(sizes, seeds, out_dir=None, processes=None):
+    """Generate every (size, seed) in a process pool, return [(nlot, seed, makespan or None)]."""
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+    tasks = [(nlot, seed, out_dir) for nlot in sizes for seed in seeds]
+    if processes == 1:
+        return [generate_one(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(generate_one, tasks, chunksize=CHUNKSIZE))
+
+
+def main(sizes=SIZES, gantt_dir=None):
+    for n in sizes:
+        _, _, makespan = generate_data(n, gantt_dir, seed=n)
+        print('%i lots, arrival-order makespan %i' % (n, makespan))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument('--gantt-dir', help='write the chart of every instance to this directory')
+    parser.add_argument('--count', type=int, help='generate seeds 0..count-1 of every size in a process pool')
+    parser.add_argument('--out', help='with --count: write every instance to this directory')
+    parser.add_argument('--processes', type=int, help='with --count: pool size, all cores by default')
+    args = parser.parse_args()
+
+    if args.count is None:
+        main(args.sizes, args.gantt_dir)
     else:
-        generate_data(nlot)
-
-
-for n in range(2, 10):
-    generate_data(n)
-
-for n in range(10, 100, 10):
-    generate_data(n)
-
-for n in range(100, 501, 50):
-    generate_data(n)
\ No newline at end of file
+        start = time.perf_counter()
+        made = generate_many(args.sizes, range(args.count), args.out, args.processes)
+        elapsed = time.perf_counter() - start
+        print('%i instances, %i infeasible, %.2fs (%.0f per minute)' % (
+            len(made), sum(m is None for _, _, m in made), elapsed, 60 * len(made) / elapsed))
@@ -0,0 +1,16 @@
+"""Name -> solver class lookup shared by the experiment runners, imported on first use."""
+import importlib
+
+ENGINES = {
+    'cp': ('single_machine_setup_cp', 'SingleSetupOrtoolsCP'),
+    'lp': ('single_machine_setup_lp', 'SingleSetupOrtoolsLP'),
+    'copt': ('single_machine_setup_copt', 'SingleSetupCOPT'),
+    'heuristic': ('single_machine_setup_heuristic', 'SingleSetupHeuristic'),
+}
+
+
+def get_engine(name):
+    if name not in ENGINES:
+        raise ValueError('Unknown engine: %s' % name)
+    module, cls = ENGINES[name]
+    return getattr(importlib.import_module(module), cls)
@@ -1,52 +1,38 @@
-import numpy as np
-import xlrd
-import xlwt
+import os
 
-from Lot import Lot
+from instance_io import instance_path, load_instance
 import single_machine_setup_cp as cp
 import single_machine_setup_lp as lp
-import single_machine_setup_copt as cop
+
+
+def read_excel(name):
+    """Return (lots, ttmatrix) of an instance file, .xls or .npz, through the instance_io cache."""
+    return load_instance(name)
 
 
 class SingleMachineExperiment:
 
     def __init__(self):
+        import xlwt
+
         self.lots = None
         self.ttmatrix = None
         self.orcpbook = xlwt.Workbook()
         self.orlpbook = xlwt.Workbook()
         self.coptbook = xlwt.Workbook()
+        self.gantt_dir = 'data/gantt'  # None shows every chart and waits for its window to close
 
-    def read_excel(self, name):
-        wbook = xlrd.open_workbook(name)
-
-        # read lot information
-        lots = []
-        ltable = wbook.sheet_by_name('lot_data')
-
-        for i in range(1, ltable.nrows):
-            r = ltable.row(i)
-            lots.append(Lot(idx=int(r[0].value),
-                            arrivet=int(r[1].value),
-                            processt=int(r[2].value),
-                            ltype=int(r[3].value)
-                            )
-                        )
-            print(lots[-1])
-        self.lots = lots
+    def gantt_file(self, mdl, size):
+        if self.gantt_dir is None:
+            return None
+        os.makedirs(self.gantt_dir, exist_ok=True)
+        return os.path.join(self.gantt_dir, '%s_%i.png' % (type(mdl).__name__, size))
 
-        # read type transformation information
-        ttable = wbook.sheet_by_name('setup_matrix')
-
-        ntype = ttable.nrows
-        ttmatrix = np.zeros((ntype, ntype))
-
-        for i in range(ntype):
-            for j in range(ntype):
-                ttmatrix[i][j] = int(ttable.cell(i, j).value)
-
-        self.ttmatrix = ttmatrix
-        print(ttmatrix)
+    def read_excel(self, name):
+        self.lots, self.ttmatrix = read_excel(name)
+        for lot in self.lots:
+            print(lot)
+        print(self.ttmatrix)
 
     def ortools_cp_experiments(self):
         wbook = self.orcpbook
@@ -55,6 +41,7 @@ class SingleMachineExperiment:
         wtbale.write(0, 1, 'time')
         wtbale.write(0, 2, 'objv')
         wtbale.write(0, 3, 'status')
+        wtbale.write(0, 4, 'gap')
 
         rowcount = 1
         for n in range(2, 10):
@@ -70,18 +57,20 @@ class SingleMachineExperiment:
             rowcount += 1
 
     def ortools_cp_single_experiment(self, size, row, table):
-        filename = 'data/%i.xls' % size
+        filename = instance_path('data', size)
         self.read_excel(filename)
         mdl = cp.SingleSetupOrtoolsCP(self.lots, self.ttmatrix)
-        mdl.main(300)
+        mdl.main(300, gantt_file=self.gantt_file(mdl, size))
         time = mdl.get_solve_time()
         status = mdl.get_solve_status()
         obj = mdl.get_objective_value()
+        gap = mdl.get_gap()
 
         table.write(row, 0, size)
         table.write(row, 1, time)
         table.write(row, 2, obj)
         table.write(row, 3, status)
+        table.write(row, 4, gap)
 
     def save_ortools_cp_result(self):
         self.orcpbook.save('data/result.xls')
@@ -93,6 +82,7 @@ class SingleMachineExperiment:
         wtbale.write(0, 1, 'time')
         wtbale.write(0, 2, 'objv')
         wtbale.write(0, 3, 'status')
+        wtbale.write(0, 4, 'gap')
 
         rowcount = 1
         for n in range(2, 10):
@@ -108,18 +98,20 @@ class SingleMachineExperiment:
             rowcount += 1
 
     def ortools_lp_single_experiment(self, size, row, table):
-        filename = 'data/%i.xls' % size
+        filename = instance_path('data', size)
         self.read_excel(filename)
         mdl = lp.SingleSetupOrtoolsLP(self.lots, self.ttmatrix)
-        mdl.main(300)
+        mdl.main(300, gantt_file=self.gantt_file(mdl, size))
         time = mdl.get_solve_time()
         status = mdl.get_solve_status()
         obj = mdl.get_objective_value()
+        gap = mdl.get_gap()
 
         table.write(row, 0, size)
         table.write(row, 1, time)
         table.write(row, 2, obj)
         table.write(row, 3, status)
+        table.write(row, 4, gap)
 
     def save_ortools_lp_result(self):
         self.orlpbook.save('data/result1.xls')
@@ -131,6 +123,7 @@ class SingleMachineExperiment:
         wtbale.write(0, 1, 'time')
         wtbale.write(0, 2, 'objv')
         wtbale.write(0, 3, 'status')
+        wtbale.write(0, 4, 'gap')
 
         rowcount = 1
         for n in range(2, 10):
@@ -146,18 +139,23 @@ class SingleMachineExperiment:
             rowcount += 1
 
     def copt_single_experiment(self, size, row, table):
-        filename = 'data/%i.xls' % size
+        # coptpy is only needed for COPT sweeps
+        import single_machine_setup_copt as cop
+
+        filename = instance_path('data', size)
         self.read_excel(filename)
         mdl = cop.SingleSetupCOPT(self.lots, self.ttmatrix)
-        mdl.main(300)
+        mdl.main(300, gantt_file=self.gantt_file(mdl, size))
         time = mdl.get_solve_time()
         status = mdl.get_solve_status()
         obj = mdl.get_objective_value()
+        gap = mdl.get_gap()
 
         table.write(row, 0, size)
         table.write(row, 1, time)
         table.write(row, 2, obj)
         table.write(row, 3, status)
+        table.write(row, 4, gap)
 
     def save_copt_result(self):
         self.coptbook.save('data/result2.xls')
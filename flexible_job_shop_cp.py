@@ -0,0 +1,332 @@
+"""Minimize the makespan of a flexible job shop: jobs of ordered operations, each on one of its eligible
+machines, with optional sequence-dependent setups between job types on every machine."""
+import math
+import time
+
+import numpy as np
+
+from Lot import Job, Lot, Operation
+from schedule_check import check_schedule
+from graph import parallel_machine_setup_gantt
+import single_machine_setup_cp as cp
+
+"""Test Date"""
+# Brandimarte text format: jobs machines, then per job: operations, per operation: alternatives (machine time)*
+fjs_data = '''3 3
+3 2 1 4 2 5 1 3 3 2 2 4 3 3
+2 1 1 5 2 2 3 3 2
+3 1 2 3 2 1 2 3 3 1 1 4
+'''
+job_types = [0, 1, 0]
+machine_tt_matrix = [[[0, 2], [2, 0]], [[0, 1], [3, 0]], [[0, 2], [1, 0]]]
+
+# best known makespans of the Brandimarte instances
+BEST_KNOWN = {'mk01': 40, 'mk02': 26, 'mk03': 204, 'mk04': 60, 'mk05': 172,
+              'mk06': 57, 'mk07': 139, 'mk08': 523, 'mk09': 307, 'mk10': 197}
+
+
+def parse_fjs(text, ltypes=None, arrivets=None):
+    """Jobs and machine count from the Brandimarte / Hurink .fjs text format, machines are 1-based in the
+    file and 0-based in the jobs. ltypes and arrivets default to 0 for every job."""
+    lines = [line.split() for line in text.splitlines() if line.strip()]
+    njob, nmachine = int(lines[0][0]), int(lines[0][1])
+
+    jobs = []
+    for j, line in enumerate(lines[1:njob + 1]):
+        values = [int(v) for v in line]
+        operations = []
+        pos = 1
+        for o in range(values[0]):
+            nalt = values[pos]
+            pairs = values[pos + 1:pos + 1 + 2 * nalt]
+            operations.append(Operation(j, o, {m - 1: p for m, p in zip(pairs[::2], pairs[1::2])}))
+            pos += 1 + 2 * nalt
+        jobs.append(Job(idx=j,
+                        ltype=0 if ltypes is None else ltypes[j],
+                        arrivet=0 if arrivets is None else arrivets[j],
+                        operations=operations))
+    return jobs, nmachine
+
+
+def load_fjs(path, ltypes=None, arrivets=None):
+    with open(path) as f:
+        return parse_fjs(f.read(), ltypes, arrivets)
+
+
+def machine_setups(ttmatrix, nmachine):
+    """nmachine x types x types setups from one shared matrix or one per machine, None without setups."""
+    if ttmatrix is None:
+        return None
+    setups = np.asarray(ttmatrix, dtype=np.int64)
+    if setups.ndim == 2:
+        setups = np.repeat(setups[None, :, :], nmachine, axis=0)
+    return setups if setups.any() else None
+
+
+def greedy_schedule(jobs, nmachine, setups=None):
+    """Earliest completion list schedule: repeatedly run the next operation of some job on the machine
+    where it completes first, after the setup from the previous job type on that machine.
+    Return {(job position, operation index): (machine, start time)}."""
+    ready = [job.arrivet for job in jobs]
+    nxt = [0] * len(jobs)
+    free = [0] * nmachine
+    last = [-1] * nmachine
+    setup = None if setups is None else setups.tolist()
+
+    schedule = {}
+    active = [j for j, job in enumerate(jobs) if job.operations]
+    while active:
+        best = None
+        for j in active:
+            op = jobs[j].operations[nxt[j]]
+            ltype = jobs[j].ltype
+            for k, p in op.alternatives.items():
+                s = free[k]
+                if setup is not None and last[k] >= 0:
+                    s += setup[k][last[k]][ltype]
+                s = max(s, ready[j])
+                if best is None or (s + p, s) < best[:2]:
+                    best = (s + p, s, j, k)
+        end, start, j, k = best
+        schedule[j, nxt[j]] = (k, start)
+        free[k], last[k], ready[j] = end, jobs[j].ltype, end
+        nxt[j] += 1
+        if nxt[j] == len(jobs[j].operations):
+            active.remove(j)
+    return schedule
+
+
+class FlexibleJobShopCP(cp.SingleSetupOrtoolsCP):
+    """Every operation picks one machine through an optional interval per eligible machine, operations
+    of a job run in order and machines keep their own AddNoOverlap. With setups every machine gets an
+    AddCircuit over its operations whose arcs carry the setup between the job types; window keeps only
+    arcs between eligible operations at most window positions apart in the greedy start order, plus the greedy
+    arcs, so large instances stay buildable at the price of possibly cutting off the optimum."""
+
+    def __init__(self, jobs, nmachine, ttmatrix=None, window=None):
+        super().__init__(jobs, ttmatrix)
+        self.jobs = jobs
+        self.nmachine = nmachine
+        self.window = window
+        self.setups = machine_setups(ttmatrix, nmachine)
+        ntype = max((job.ltype for job in jobs), default=-1) + 1
+        if self.setups is not None and self.setups.shape[1] < ntype:
+            raise ValueError('Setup matrix covers %i job types, the jobs use %i' % (self.setups.shape[1], ntype))
+        self.ops = [(j, o) for j, job in enumerate(jobs) for o in range(len(job.operations))]
+        self.start = None
+        self.end = None
+        self.presence = None
+
+    def get_operation(self, key):
+        j, o = key
+        return self.jobs[j].operations[o]
+
+    def hint_feasible(self, hint):
+        """True if hint starts every job at its arrival or later, keeps the operations of a job in order
+        and every machine sequence passes check_schedule with the adjacent setups of that machine.
+        ValueError if an operation is missing or on a machine it cannot use."""
+        for key in self.ops:
+            if key not in hint or hint[key][0] not in self.get_operation(key).alternatives:
+                raise ValueError('initial_schedule has no eligible machine for operation %s' % (key,))
+        for j, job in enumerate(self.jobs):
+            ready = job.arrivet
+            for o, op in enumerate(job.operations):
+                k, st = hint[j, o]
+                if st < ready:
+                    return False
+                ready = st + op.alternatives[k]
+
+        ntype = max(job.ltype for job in self.jobs) + 1
+        keys = [[] for _ in range(self.nmachine)]
+        for key in self.ops:
+            keys[hint[key][0]].append(key)
+        for k, on in enumerate(keys):
+            ltype = np.array([self.jobs[j].ltype for j, _ in on], dtype=np.int64)
+            processt = np.array([self.get_operation(key).alternatives[k] for key in on], dtype=np.int64)
+            startt = np.array([hint[key][1] for key in on], dtype=np.float64)
+            setup = self.setups[k] if self.setups is not None else np.zeros((ntype, ntype), dtype=np.int64)
+            if not check_schedule(np.zeros(len(on), dtype=np.int64), processt, ltype, startt, setup,
+                                  adjacent=True)['feasible']:
+                return False
+        return True
+
+    def calculate_bounds(self, hint):
+        """Horizon: makespan of the hint, which must be feasible. Lower bound: the longest job chain with shortest processing,
+        the shortest total work spread over the machines, and the work that only one machine can do."""
+        jobs = self.jobs
+        pmin = {key: min(self.get_operation(key).alternatives.values()) for key in self.ops}
+        horizon = max(st + self.get_operation(key).alternatives[k] for key, (k, st) in hint.items())
+
+        chain = max(job.arrivet + sum(pmin[j, o] for o in range(len(job.operations))) for j, job in enumerate(jobs))
+        spread = min(job.arrivet for job in jobs) + math.ceil(sum(pmin.values()) / self.nmachine)
+        dedicated = [0] * self.nmachine
+        for key in self.ops:
+            alternatives = self.get_operation(key).alternatives
+            if len(alternatives) == 1:
+                k, p = next(iter(alternatives.items()))
+                dedicated[k] += p
+        return horizon, max(chain, spread, max(dedicated)), pmin
+
+    def add_machine_circuit(self, k, keys, hint_arcs, hint):
+        model = self.model
+        setup = self.setups[k].tolist()
+        ltype = [job.ltype for job in self.jobs]
+        rank = {key: r for r, key in enumerate(sorted(keys, key=lambda key: hint[key][1]))}
+
+        # node len(keys) is the depot, a self loop on an operation skips it on this machine
+        depot = len(keys)
+        arcs = [(depot, depot, model.NewBoolVar('empty_%i' % k))]
+        for a, ka in enumerate(keys):
+            arcs.append((a, a, self.presence[ka + (k,)].Not()))
+            arcs.append((depot, a, model.NewBoolVar('start_%i_%i_%i' % (ka + (k,)))))
+            arcs.append((a, depot, model.NewBoolVar('end_%i_%i_%i' % (ka + (k,)))))
+            for b, kb in enumerate(keys):
+                if a == b or (ka[0] == kb[0] and ka[1] > kb[1]):
+                    continue  # operations of one job keep their order
+                if self.window is not None and abs(rank[ka] - rank[kb]) > self.window and (ka, kb) not in hint_arcs:
+                    continue
+                l_ab = model.NewBoolVar('l_%i_%i_%i_%i_%i' % (ka + kb + (k,)))  # successor on machine k
+                model.Add(self.end[ka] + setup[ltype[ka[0]]][ltype[kb[0]]] <= self.start[kb]).OnlyEnforceIf(l_ab)
+                arcs.append((a, b, l_ab))
+        model.AddCircuit(arcs)
+        return keys, arcs
+
+    def hint_sequences(self, hint):
+        seqs = [[] for _ in range(self.nmachine)]
+        for key in sorted(hint, key=lambda key: hint[key][1]):
+            seqs[hint[key][0]].append(key)
+        return seqs
+
+    def add_hint(self, hint):
+        model = self.model
+        for key, (k, st) in hint.items():
+            model.AddHint(self.start[key], st)
+            model.AddHint(self.end[key], st + self.get_operation(key).alternatives[k])
+        for (j, o, k), literal in self.presence.items():
+            model.AddHint(literal, hint[j, o][0] == k)
+        model.AddHint(self.obj, max(st + self.get_operation(key).alternatives[k] for key, (k, st) in hint.items()))
+
+        if self.arcs is None:
+            return
+        for k, seq in enumerate(self.hint_sequences(hint)):
+            keys, arcs = self.arcs[k]
+            node = {key: a for a, key in enumerate(keys)}
+            depot = len(keys)
+            nodes = [node[key] for key in seq]
+            succ = dict(zip([depot] + nodes, nodes + [depot]))
+            for a, b, literal in arcs:
+                if a != b:
+                    model.AddHint(literal, succ.get(a) == b)
+                elif a == depot:
+                    model.AddHint(literal, not seq)
+
+    def build_model(self, initial_schedule=None):
+        """initial_schedule: optional {(job position, operation index): (machine, start time)},
+        the greedy schedule by default. The horizon and the window arcs come from initial_schedule only
+        if it passes hint_feasible, otherwise from the greedy schedule and initial_schedule is only a hint."""
+        start_time = time.perf_counter()
+        model = self.model
+        profile = self.profile
+
+        with profile.phase('bounds'):
+            greedy = None if initial_schedule is not None and self.hint_feasible(initial_schedule) else \
+                greedy_schedule(self.jobs, self.nmachine, self.setups)
+            hint = initial_schedule if initial_schedule is not None else greedy
+            # the schedule that bounds the horizon and keeps the window feasible
+            feasible = hint if greedy is None else greedy
+            horizon, self.lower_bound, pmin = self.calculate_bounds(feasible)
+            self.horizon = horizon
+
+        with profile.phase('variables'):
+            obj = model.NewIntVar(self.lower_bound, horizon, 'obj')
+            start, end, presence = {}, {}, {}
+            intervals = [[] for _ in range(self.nmachine)]
+            for j, job in enumerate(self.jobs):
+                nop = len(job.operations)
+                head = job.arrivet
+                tail = sum(pmin[j, o] for o in range(nop))
+                for o, op in enumerate(job.operations):
+                    start[j, o] = model.NewIntVar(head, horizon - tail, 's_%i_%i' % (j, o))
+                    end[j, o] = model.NewIntVar(head + pmin[j, o], horizon - tail + pmin[j, o], 'e_%i_%i' % (j, o))
+                    head += pmin[j, o]
+                    tail -= pmin[j, o]
+                    for k, p in op.alternatives.items():
+                        literal = model.NewBoolVar('a_%i_%i_%i' % (j, o, k))  # operation (j, o) on machine k
+                        intervals[k].append(model.NewOptionalIntervalVar(start[j, o], p, end[j, o], literal,
+                                                                         'interval_%i_%i_%i' % (j, o, k)))
+                        presence[j, o, k] = literal
+        self.start, self.end, self.presence, self.obj = start, end, presence, obj
+
+        with profile.phase('precedence'):
+            for j, job in enumerate(self.jobs):
+                nop = len(job.operations)
+                for o in range(nop):
+                    model.AddExactlyOne(presence[j, o, k] for k in job.operations[o].alternatives)
+                    if o + 1 < nop:
+                        model.Add(end[j, o] <= start[j, o + 1])
+                if nop:
+                    model.Add(obj >= end[j, nop - 1])
+            for k in range(self.nmachine):
+                model.AddNoOverlap(intervals[k])
+
+        if self.setups is not None:
+            with profile.phase('setup'):
+                seqs = self.hint_sequences(feasible)
+                self.arcs = []
+                for k in range(self.nmachine):
+                    keys = [key for key in self.ops if k in self.get_operation(key).alternatives]
+                    self.arcs.append(self.add_machine_circuit(k, keys, set(zip(seqs[k], seqs[k][1:])), feasible))
+
+        with profile.phase('hint'):
+            self.add_hint(hint)
+
+        model.Minimize(obj)
+        self.build_time = time.perf_counter() - start_time
+        profile.counts['nvariables'], profile.counts['nconstraints'] = self.get_model_size()
+
+    def save_result(self):
+        solver = self.solver
+        for (j, o, k), literal in self.presence.items():
+            if solver.Value(literal):
+                op = self.jobs[j].operations[o]
+                op.machine = k
+                op.startt = solver.Value(self.start[j, o])
+        for job in self.jobs:
+            if job.operations:
+                job.startt = job.operations[0].startt
+        self.objv = solver.Value(self.obj)
+
+    def get_schedule(self):
+        """{(job position, operation index): (machine, start time)}, the format of initial_schedule."""
+        return {(j, o): (op.machine, op.startt) for j, job in enumerate(self.jobs) for o, op in enumerate(job.operations)}
+
+    def get_best_known_gap(self, name):
+        """Relative gap of the solution to the published best makespan of a Brandimarte instance."""
+        return (self.objv - BEST_KNOWN[name]) / BEST_KNOWN[name]
+
+    def show_solve_status_and_result(self):
+        print('Solution Status: ' + self.get_solve_status())
+        if self.has_solution():
+            for k in range(self.nmachine):
+                row = sorted(((op, job) for job in self.jobs for op in job.operations if op.machine == k),
+                             key=lambda item: item[0].startt)
+                print('Machine %i: ' % k + ' '.join('job_%i.%i:t%i[%i->%i]' % (
+                    job.idx, op.index, job.ltype, op.startt, op.startt + op.alternatives[k]) for op, job in row))
+            print('Optimal Objective: %s' % self.objv)
+
+    def show_gantt_chart(self, path=None):
+        if not self.has_solution():
+            print('No gantt chart to show!')
+            return
+        bars = [Lot(idx=job.idx, ltype=job.ltype, arrivet=job.arrivet, processt=op.alternatives[op.machine],
+                    startt=op.startt, machine=op.machine) for job in self.jobs for op in job.operations]
+        # __init__ checked that the setups cover every job type
+        ntype = max(job.ltype for job in self.jobs) + 1
+        setups = self.setups if self.setups is not None else np.zeros((self.nmachine, ntype, ntype), dtype=np.int64)
+        parallel_machine_setup_gantt(bars, setups.tolist(), path=path)
+
+
+if __name__ == '__main__':
+    jobs1, nmachine1 = parse_fjs(fjs_data, ltypes=job_types)
+    fjsp = FlexibleJobShopCP(jobs1, nmachine1, machine_tt_matrix)
+    fjsp.main()
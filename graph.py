@@ -1,88 +1,154 @@
-import matplotlib.pyplot as plt
-from copy import deepcopy
+"""Gantt charts. matplotlib is imported on the first chart, solver modules import this module for free."""
+import math
+import os
 
-font = {
-    "family": "Microsoft YaHei",
-    "style": "oblique",
-    "weight": "bold",
-    "color": "black",
-    "size": 14
-}
+import numpy as np
 
-font_task = deepcopy(font)
-font_task['color'] = 'black'
+from Lot import LotTable, lot_arrays, lot_column, table_rows
 
-font_setup = deepcopy(font)
-font_setup['color'] = 'r'
+COLORMAP = 'Paired'  # bar color
+TITLE = '甘特图'
+XLABEL = '加工时间 /h'
+YLABEL = 'Machine'
+MAX_LABELS = 60  # labelled lots per machine row and page, every k-th lot above it
+PAGE_WIDTH = 25  # [inch]
 
-# bar color
-colormap = plt.get_cmap('Paired')
 
+FONT_RC = {'font.sans-serif': ['SimHei', 'DejaVu Sans'],  # 显示中文标签
+           'axes.unicode_minus': False}
 
-def gantt_set_figure():
-    plt.rcParams['font.sans-serif'] = ['SimHei']  # 显示中文标签
-    plt.rcParams['axes.unicode_minus'] = False  # 显示中文标签
-    plt.rcParams["figure.figsize"] = (25, 2)
-
-
-def add_lot_bar(lot, yaxis):
-    st = lot.startt
-    pt = lot.processt
-    color = colormap(lot.ltype)
-    plt.barh(y=yaxis, width=pt, left=st, edgecolor="black", color=color)
-
-
-def add_setup_bar(yaxis, lot, tt):
-    xaxis = lot.startt + lot.processt
-    plt.barh(y=yaxis, width=tt, left=xaxis, edgecolor='black', color='w')
-
-
-def get_lot_type(lots, i):
-    return lots[i].ltype
 
+def gantt_set_figure():
+    import matplotlib.pyplot as plt
 
-def add_lot_text(seq, lot, yaxis):
-    idx = lot.idx
-    ltp = lot.ltype
-    at = lot.arrivet
-    st = lot.startt
-    pt = lot.processt
-
-    # lot information
-    plt.text(y=yaxis + 0.3 if seq % 2 == 0 else yaxis + 0, x=st + 0.1,
-             s='lot_%i: t%i, %i' % (idx, ltp, at), fontdict=font_task)
-    # process information
-    plt.text(y=yaxis + 0.15 if seq % 2 == 0 else yaxis - 0.15, x=st + 0.1,
-             s='        [%i, %i]' % (round(st), round(st) + pt), fontdict=font_task)
-
+    plt.rcParams.update(FONT_RC)
+    plt.rcParams["figure.figsize"] = (25, 2)
 
-def add_setup_text(yaxis, lot, t1, t2, tt):
-    xaxis = lot.startt + lot.processt
-    plt.text(y=yaxis - 0.2, x=xaxis + 0.2, s='type:%i->%i' % (t1, t2), fontdict=font_setup)
-    plt.text(y=yaxis - 0.35, x=xaxis + 0.2, s='time:%i' % tt, fontdict=font_setup)
 
+def gantt_rows(lots, tt_matrices, durations=None):
+    """Per machine row: lot columns in start order and the setup bars between adjacent lots of different
+    type. Lots without a machine are on row 0. durations {lot idx: processing time}, lot.processt if None."""
+    arrivet, processt, ltype = lot_arrays(lots)
+    idx = lot_column(lots, 'idx')
+    startt = lot_column(lots, 'startt', np.float64).astype(np.float64)
+    if durations is not None:
+        processt = np.array([durations[i] for i in idx.tolist()], dtype=np.int64)
+    if isinstance(lots, LotTable) or table_rows(lots) is not None:
+        machine = np.maximum(lot_column(lots, 'machine'), 0)  # -1 for no machine
+    else:
+        machine = np.array([0 if getattr(lot, 'machine', None) is None else lot.machine for lot in lots],
+                           dtype=np.int64)
+
+    rows = []
+    for k, tt in enumerate(tt_matrices):
+        sel = np.flatnonzero(machine == k)
+        sel = sel[np.argsort(startt[sel], kind='stable')]
+        row = {'idx': idx[sel], 'ltype': ltype[sel], 'arrivet': arrivet[sel],
+               'startt': startt[sel], 'processt': processt[sel]}
+        t1, t2 = row['ltype'][:-1], row['ltype'][1:]
+        setup = np.asarray(tt)[t1, t2]
+        change = (t1 != t2) & (setup > 0)
+        row['setup'] = {'startt': (row['startt'] + row['processt'])[:-1][change], 'width': setup[change],
+                        'from': t1[change], 'to': t2[change]}
+        rows.append(row)
+    return rows
+
+
+def draw_gantt(ax, rows, xlim=None, max_labels=MAX_LABELS):
+    """All lot bars of a machine row in one broken_barh call, setups in a second one. Lots are labelled
+    in full up to max_labels per row in xlim, above that only every k-th lot gets its index."""
+    from matplotlib import colormaps
+
+    colormap = colormaps[COLORMAP]
+    for k, row in enumerate(rows):
+        startt, processt, setup = row['startt'], row['processt'], row['setup']
+        ax.broken_barh(np.column_stack((startt, processt)), (k - 0.4, 0.8),
+                       facecolors=colormap(row['ltype'] % colormap.N), edgecolors='black', linewidths=0.5)
+        if len(setup['startt']):
+            ax.broken_barh(np.column_stack((setup['startt'], setup['width'])), (k - 0.4, 0.8),
+                           facecolors='w', edgecolors='r', linewidths=0.5, hatch='//')
+
+        visible = np.ones(len(startt), dtype=bool) if xlim is None else \
+            (startt + processt > xlim[0]) & (startt < xlim[1])
+        shown = np.flatnonzero(visible)
+        full = len(shown) <= max_labels
+        for n, i in enumerate(shown[::max(1, math.ceil(len(shown) / max_labels))].tolist()):
+            st, pt = startt[i], processt[i]
+            if full:
+                text = 'lot_%i: t%i, %i\n[%i, %i]' % (row['idx'][i], row['ltype'][i], row['arrivet'][i],
+                                                      round(st), round(st) + pt)
+            else:
+                text = '%i' % row['idx'][i]
+            ax.text(st + 0.1, k + (0.15 if n % 2 == 0 else -0.25), text, fontsize=8 if full else 6, clip_on=True)
+        if full and len(setup['startt']) <= max_labels:
+            for st, tt, t1, t2 in zip(*(setup[c].tolist() for c in ('startt', 'width', 'from', 'to'))):
+                ax.text(st + 0.1, k - 0.35, '%i->%i: %i' % (t1, t2, tt), fontsize=7, color='r', clip_on=True)
+
+    if xlim is not None:
+        ax.set_xlim(*xlim)
+    ax.set_yticks(range(len(rows)))
+    ax.set_ylim(-0.6, len(rows) - 0.4)
+
+
+def page_paths(path, npage):
+    if npage == 1:
+        return [path]
+    root, ext = os.path.splitext(path)
+    return ['%s_%i%s' % (root, p, ext) for p in range(npage)]
+
+
+def save_gantt(lots, tt_matrices, path, durations=None, page_span=None, max_labels=MAX_LABELS, title=TITLE):
+    """Render without a display and write one file per page, the format from the extension of path
+    (.png, .svg, .pdf). page_span: time units per page, the whole schedule on one page if None;
+    pages after the first get the suffix _1, _2, ... Return the written paths."""
+    from matplotlib import rc_context
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    rows = gantt_rows(lots, tt_matrices, durations)
+    ends = [float((row['startt'] + row['processt']).max()) for row in rows if len(row['startt'])]
+    makespan = max(ends) if ends else 0
+    npage = 1 if page_span is None else max(1, math.ceil(makespan / page_span))
+
+    paths = page_paths(path, npage)
+    for p, page_path in enumerate(paths):
+        xlim = (0, makespan) if page_span is None else (p * page_span, (p + 1) * page_span)
+        with rc_context(FONT_RC):
+            fig = Figure(figsize=(PAGE_WIDTH, 1 + 1.2 * len(rows)))
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot()
+            draw_gantt(ax, rows, xlim, max_labels)
+            ax.set_title(title if npage == 1 else '%s (%i/%i)' % (title, p + 1, npage))
+            ax.set_xlabel(XLABEL)
+            ax.set_ylabel(YLABEL)
+            fig.savefig(page_path, bbox_inches='tight')
+    return paths
+
+
+def single_machine_setup_gantt(lots, tt_matrix, path=None, page_span=None, max_labels=MAX_LABELS):
+    """Show the chart, or with path write it headless through save_gantt. page_span only splits files,
+    the window shows the whole schedule."""
+    return parallel_machine_setup_gantt(lots, [tt_matrix], None, path, page_span, max_labels)
+
+
+def parallel_machine_setup_gantt(lots, tt_matrices, durations=None, path=None, page_span=None,
+                                 max_labels=MAX_LABELS):
+    """One row per machine. tt_matrices[k] is the setup matrix of machine k,
+    durations {lot idx: processing time on its assigned machine}, lot.processt if None.
+    With path the chart is written headless through save_gantt, page_span only splits files."""
+    if path is not None:
+        return save_gantt(lots, tt_matrices, path, durations, page_span, max_labels)
+
+    import matplotlib.pyplot as plt
 
-def single_machine_setup_gantt(lots, tt_matrix):
-    # gantt chart setting
     gantt_set_figure()
-
-    # add lot bar
-    for idx, lot in enumerate(lots):
-        add_lot_bar(lot, 1)
-        add_lot_text(idx, lot, 1)
-
-    # add setup time bar
-    for idx, lot in enumerate(lots[:-1]):
-        t1, t2 = get_lot_type(lots, idx), get_lot_type(lots, idx + 1)
-        if t1 == t2:
-            continue
-
-        tt = tt_matrix[t1][t2]
-        add_setup_bar(1, lot, tt)
-        add_setup_text(1, lot, t1, t2, tt)
-
-    plt.title("甘特图")
-    plt.xlabel("加工时间 /h")
-    plt.ylabel("Machine")
+    nmachine = len(tt_matrices)
+    if nmachine > 1:
+        plt.rcParams["figure.figsize"] = (25, 1.5 * nmachine)
+    draw_gantt(plt.gca(), gantt_rows(lots, tt_matrices, durations), max_labels=max_labels)
+
+    plt.title(TITLE)
+    plt.xlabel(XLABEL)
+    plt.ylabel(YLABEL)
 
     plt.show()
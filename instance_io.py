@@ -0,0 +1,93 @@
+"""Instance files: lot arrays and setup matrix in one .npz, converters from the .xls workbooks and a load cache."""
+import functools
+import glob
+import os
+
+import numpy as np
+
+from Lot import Lot, LotTable
+
+CACHE_SIZE = 64
+
+
+def save_npz(path, lots, ttmatrix):
+    """lots: a list of Lots or a LotTable, written in idx order."""
+    table = LotTable.from_lots(lots)
+    order = np.argsort(table.idx, kind='stable')
+    np.savez(path,
+             idx=table.idx[order],
+             arrivet=table.arrivet[order],
+             processt=table.processt[order],
+             ltype=table.ltype[order],
+             ttmatrix=np.asarray(ttmatrix, dtype=np.int64))
+
+
+def read_npz(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def read_xls(path):
+    """Parse a workbook written by data_generator.write_to_xls column by column."""
+    import xlrd
+
+    wbook = xlrd.open_workbook(path)
+    ltable = wbook.sheet_by_name('lot_data')
+    idx, arrivet, processt, ltype = (np.array(ltable.col_values(c, start_rowx=1), dtype=np.int64) for c in range(4))
+    ttable = wbook.sheet_by_name('setup_matrix')
+    ttmatrix = np.array([ttable.row_values(i) for i in range(ttable.nrows)], dtype=np.int64)
+    return {'idx': idx, 'arrivet': arrivet, 'processt': processt, 'ltype': ltype, 'ttmatrix': ttmatrix}
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _load_arrays(path, mtime):
+    arrays = read_xls(path) if path.endswith('.xls') else read_npz(path)
+    for a in arrays.values():
+        a.setflags(write=False)
+    return arrays
+
+
+def load_arrays(path):
+    """Return the instance arrays of path, parsed once per (path, mtime) and shared read-only afterwards."""
+    path = os.path.abspath(path)
+    return _load_arrays(path, os.stat(path).st_mtime_ns)
+
+
+def load_instance(path):
+    """Return (lots, ttmatrix) of an .npz or .xls instance; lots are new objects on every call."""
+    arrays = load_arrays(path)
+    lots = [Lot(idx=i, arrivet=at, processt=pt, ltype=tp)
+            for i, at, pt, tp in zip(arrays['idx'].tolist(), arrays['arrivet'].tolist(),
+                                     arrays['processt'].tolist(), arrays['ltype'].tolist())]
+    return lots, arrays['ttmatrix'].copy()
+
+
+def instance_path(data_dir, size):
+    """Prefer data_dir/size.npz over data_dir/size.xls."""
+    path = os.path.join(data_dir, '%i.npz' % size)
+    return path if os.path.exists(path) else os.path.join(data_dir, '%i.xls' % size)
+
+
+def convert_xls(xls_path, npz_path=None):
+    npz_path = npz_path or os.path.splitext(xls_path)[0] + '.npz'
+    arrays = read_xls(xls_path)
+    np.savez(npz_path, **arrays)
+    return npz_path
+
+
+def convert_dir(data_dir='data'):
+    """Write an .npz next to every instance workbook N.xls in data_dir."""
+    paths = []
+    for xls_path in sorted(glob.glob(os.path.join(data_dir, '*.xls'))):
+        if os.path.splitext(os.path.basename(xls_path))[0].isdigit():
+            paths.append(convert_xls(xls_path))
+    return paths
+
+
+def clear_cache():
+    _load_arrays.cache_clear()
+
+
+if __name__ == '__main__':
+    for p in convert_dir():
+        print('wrote ' + p)
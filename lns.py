@@ -0,0 +1,250 @@
+"""Large-neighborhood search on one built SingleSetupOrtoolsCP model."""
+import time
+
+import numpy as np
+
+from Lot import lot_arrays
+from graph import single_machine_setup_gantt
+from schedule_check import repair_schedule
+from single_machine_setup_heuristic import heuristic_schedule
+import single_machine_setup_cp as cp
+
+NEIGHBORHOODS = ('window', 'type', 'random')
+
+
+class SingleSetupLNS:
+    """The pairwise CP model is built once. Every iteration frees a neighborhood of lots: the lots
+    outside it keep their start and the precedence bools between them are pinned to the incumbent
+    order, by changing only the domains that differ from the previous iteration. For the scattered
+    'type' and 'random' neighborhoods the lots after the first free lot may also start later, to make
+    room. The subproblem minimizes the makespan, then the end of the neighborhood, with the incumbent
+    as complete hint and the makespan bounded by the instance lower bound and the incumbent. Its
+    solution is shifted left in the same sequence with repair_schedule, which passes the time saved
+    on to the later lots, and accepted when the makespan is not worse."""
+
+    def __init__(self, lots, ttmatrix, size=30, subsolvetime=1.0, neighborhoods=NEIGHBORHOODS, seed=0):
+        for nb in neighborhoods:
+            if nb not in NEIGHBORHOODS:
+                raise ValueError('Unknown neighborhood: %s' % nb)
+
+        self.lots = lots
+        self.ttmatrix = ttmatrix
+        self.nlot = len(lots)
+        self.size = size
+        self.subsolvetime = subsolvetime
+        self.neighborhoods = neighborhoods
+        self.rng = np.random.default_rng(seed)
+
+        self.mdl = None
+        self.order = None  # lots in the positions of the model variables
+        self.pairs = None
+        self.pair_lb = None
+        self.pair_ub = None
+        self.t_lb = None  # current start-time domains per position
+        self.t_ub = None
+        self.start_lb = None
+        self.start_ub = None
+        self.arrivet = None  # per position
+        self.processt = None
+        self.ltype = None
+        self.end = None  # end of the neighborhood
+        self.in_window = None  # per position: fixed to 1 when the lot is free
+        self.window = None
+        self.best = None  # incumbent start time per position
+        self.objv = None
+        self.status = None
+        self.solvetime = 10
+        self.solve_time = None
+        self.trace = []
+
+    def build_model(self, initial_schedule=None):
+        self.order = list(self.lots)
+        self.mdl = cp.SingleSetupOrtoolsCP(self.order, self.ttmatrix, fast=True)
+        self.mdl.build_model()
+
+        if initial_schedule is None:
+            initial_schedule = heuristic_schedule(self.order, self.ttmatrix)
+        self.best = np.array([initial_schedule[lot.idx] for lot in self.order], dtype=np.int64)
+        self.objv = self.makespan(self.best)
+
+        # makespan, then the end of the free lots, then the sum of start times
+        mdl = self.mdl
+        model = mdl.model
+        self.end = model.NewIntVar(0, mdl.horizon, 'end')
+        self.in_window = [model.NewBoolVar('w_%i' % i) for i in range(self.nlot)]
+        for ti, wi, lot in zip(mdl.t, self.in_window, self.order):
+            model.Add(self.end >= ti + lot.processt).OnlyEnforceIf(wi)
+            cp.set_domain(model, wi, 0, 0)
+        self.window = np.zeros(self.nlot, dtype=bool)
+        scale = self.nlot * mdl.horizon + 1
+        model.Minimize(mdl.obj * (scale * (mdl.horizon + 1)) + self.end * scale + sum(mdl.t))
+        # with a complete hint the sub-solves finish sooner without presolve of the mostly fixed model
+        mdl.solver.parameters.cp_model_presolve = False
+
+        self.pairs = np.array(list(self.mdl.x.keys()), dtype=np.int64).reshape(-1, 2)
+        self.pair_lb = np.zeros(len(self.pairs), dtype=np.int64)
+        self.pair_ub = np.ones(len(self.pairs), dtype=np.int64)
+        self.start_lb = np.array(self.mdl.bounds.start_lb(), dtype=np.int64)
+        self.start_ub = np.array(self.mdl.bounds.start_ub(), dtype=np.int64)
+        self.t_lb, self.t_ub = self.start_lb.copy(), self.start_ub.copy()
+        self.arrivet, self.processt, self.ltype = lot_arrays(self.order)
+
+    def makespan(self, startt):
+        return int(max(startt[i] + lot.processt for i, lot in enumerate(self.order)))
+
+    def set_solve_time(self, t):
+        self.solvetime = t
+
+    def select_neighborhood(self, kind):
+        """Return a bool mask over positions of the lots to free."""
+        nlot, size = self.nlot, min(self.size, self.nlot)
+        free = np.zeros(nlot, dtype=bool)
+        if kind == 'window':
+            seq = np.argsort(self.best, kind='stable')
+            k = self.rng.integers(0, nlot - size + 1)
+            free[seq[k:k + size]] = True
+        elif kind == 'type':
+            ltype = np.array([lot.ltype for lot in self.order])
+            same = np.flatnonzero(ltype == ltype[self.rng.integers(nlot)])
+            free[self.rng.choice(same, min(size, len(same)), replace=False)] = True
+        else:
+            free[self.rng.choice(nlot, size, replace=False)] = True
+        return free
+
+    def fix_outside(self, free, delay=False):
+        """Fix the start of the lots outside the neighborhood, delay: only bound it from below for the
+        lots after the first free lot. Pin every precedence bool between two lots outside it, only
+        touching domains that change. Return the mask of the free pairs."""
+        model = self.mdl.model
+        x = self.mdl.x
+        t = self.mdl.t
+        i, j = self.pairs[:, 0], self.pairs[:, 1]
+        fixed = ~(free[i] | free[j])
+        order = (self.best[i] < self.best[j]).astype(np.int64)
+        lb = np.where(fixed, order, 0)
+        ub = np.where(fixed, order, 1)
+        for k in np.flatnonzero((lb != self.pair_lb) | (ub != self.pair_ub)).tolist():
+            a, b = self.pairs[k].tolist()
+            cp.set_domain(model, x[a, b], int(lb[k]), int(ub[k]))
+        self.pair_lb, self.pair_ub = lb, ub
+
+        t_lb = np.where(free, self.start_lb, self.best)
+        later = free | (delay & (self.best > self.best[free].min()))
+        t_ub = np.where(later, self.start_ub, self.best)
+        for k in np.flatnonzero((t_lb != self.t_lb) | (t_ub != self.t_ub)).tolist():
+            cp.set_domain(model, t[k], int(t_lb[k]), int(t_ub[k]))
+        self.t_lb, self.t_ub = t_lb, t_ub
+
+        for k in np.flatnonzero(free != self.window).tolist():
+            cp.set_domain(model, self.in_window[k], int(free[k]), int(free[k]))
+        self.window = free
+        return ~fixed
+
+    def add_hint(self, free, open_pairs):
+        """The incumbent on every start, the objective, the neighborhood end and the precedence bools
+        that are not pinned."""
+        mdl = self.mdl
+        model = mdl.model
+        model.ClearHints()
+        for v, st in zip(mdl.t, self.best.tolist()):
+            model.AddHint(v, st)
+        i, j = self.pairs[open_pairs, 0], self.pairs[open_pairs, 1]
+        for a, b, before in zip(i.tolist(), j.tolist(), (self.best[i] < self.best[j]).tolist()):
+            model.AddHint(mdl.x[a, b], before)
+        model.AddHint(mdl.obj, self.objv)
+        model.AddHint(self.end, int((self.best + self.processt)[free].max()))
+        for wi, value in zip(self.in_window, free.tolist()):
+            model.AddHint(wi, value)
+
+    def solve_neighborhood(self, free, delay=False):
+        mdl = self.mdl
+        model = mdl.model
+        open_pairs = self.fix_outside(free, delay)
+        cp.set_domain(model, mdl.obj, mdl.lower_bound, self.objv)
+        self.add_hint(free, open_pairs)
+
+        mdl.solver.parameters.max_time_in_seconds = self.subsolvetime
+        status = mdl.solver.Solve(model)
+        if status not in (cp.cp_model.OPTIMAL, cp.cp_model.FEASIBLE):
+            return False
+        startt = repair_schedule(self.arrivet, self.processt, self.ltype,
+                                 np.array([mdl.solver.Value(v) for v in mdl.t]), self.ttmatrix)
+        objv = self.makespan(startt)
+        if objv > self.objv:
+            return False
+        self.best, self.objv = startt, objv
+        return True
+
+    def solve(self):
+        print('Start Solving...\n...')
+        start = time.perf_counter()
+        self.trace = [(0.0, self.objv)]
+        iteration = 0
+        while time.perf_counter() - start < self.solvetime:
+            kind = self.neighborhoods[iteration % len(self.neighborhoods)]
+            before = self.objv
+            self.solve_neighborhood(self.select_neighborhood(kind), delay=kind != 'window')
+            if self.objv < before:
+                self.trace.append((time.perf_counter() - start, self.objv))
+                print('  %8.2f s  %-8s obj %i' % (self.trace[-1][0], kind, self.objv))
+            iteration += 1
+
+        self.solve_time = time.perf_counter() - start
+        self.status = 'FEASIBLE'
+        print('Solve Complete.')
+        self.save_result()
+
+    def save_result(self):
+        for i, lot in enumerate(self.order):
+            lot.startt = int(self.best[i])
+        # sort lots by sequence
+        self.lots.sort(key=lambda lot: lot.startt)
+
+    def print_status_result_statistics(self):
+        self.show_solve_status_and_result()
+        self.show_solve_statistics()
+
+    def has_solution(self):
+        return self.get_solve_status() == 'FEASIBLE'
+
+    def show_solve_status_and_result(self):
+        print('Solution Status: ' + self.get_solve_status())
+        if self.has_solution():
+            cp.print_lot_schedule(self.lots, self.objv)
+
+    def show_solve_statistics(self):
+        print('Statistics')
+        print('  - improvements: %i' % (len(self.trace) - 1))
+        print('  - wall time   : %f s' % self.solve_time)
+
+    def show_gantt_chart(self, path=None):
+        if self.has_solution():
+            single_machine_setup_gantt(self.lots, self.ttmatrix, path)
+        else:
+            print('No gantt chart to show!')
+
+    def get_solve_status(self):
+        return self.status or 'NOT_SOLVED'
+
+    def get_solve_time(self):
+        return self.solve_time
+
+    def get_objective_value(self):
+        return self.objv
+
+    def get_trace(self):
+        """(wall time, objective) of the initial schedule and of every improvement."""
+        return self.trace
+
+    def main(self, solvetime=10, gantt_file=None):
+        self.build_model()
+        self.set_solve_time(solvetime)
+        self.solve()
+        self.print_status_result_statistics()
+        self.show_gantt_chart(gantt_file)
+
+
+if __name__ == '__main__':
+    lots1 = cp.create_lots_from_tuplelist(cp.lot_data)
+    lns = SingleSetupLNS(lots1, cp.type_transform_matrix, size=4, subsolvetime=0.2)
+    lns.main(2)
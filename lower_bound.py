@@ -0,0 +1,64 @@
+"""Makespan lower bounds from lots and ttmatrix, for gap reporting without a full solve."""
+import numpy as np
+
+from Lot import lot_arrays
+
+
+def min_setup_into(ltype, ttmatrix):
+    """Smallest setup into every type from another type present in the instance, 0 if it is the only type."""
+    tt = np.asarray(ttmatrix, dtype=np.int64)
+    types = np.unique(ltype)
+    sub = tt[np.ix_(types, types)].astype(float)
+    np.fill_diagonal(sub, np.inf)
+    into = np.zeros(len(tt), dtype=np.int64)
+    if len(types) > 1:
+        into[types] = sub.min(axis=0)
+    return into
+
+
+def lower_bounds(lots, ttmatrix, release=None):
+    """Return the named makespan lower bounds of the instance.
+
+    release  max(r_i + p_i)
+    preemptive  max over k of r_(k) + work released at or after r_(k); the optimum of the
+                preemptive relaxation without setups
+    setup  min release + total work + one minimum incoming setup per type but the cheapest-to-skip one
+    preemptive_setup  preemptive, plus the setup term over the types released at or after r_(k):
+                each of them but one is entered by a setup that starts after r_(k)
+    """
+    arrivet, processt, ltype = lot_arrays(lots)
+    if release is not None:
+        arrivet = np.asarray(release, dtype=np.int64)
+    if len(arrivet) == 0:
+        return {'release': 0, 'preemptive': 0, 'setup': 0, 'preemptive_setup': 0}
+
+    order = np.argsort(arrivet, kind='stable')
+    r, p, tp = arrivet[order], processt[order], ltype[order]
+    work = np.cumsum(p[::-1])[::-1]  # work released at or after r_(k)
+
+    # type tau is released at or after r_(k) while its last position in arrival order is >= k
+    into = min_setup_into(ltype, ttmatrix)
+    types = np.unique(tp)
+    last = np.zeros(len(into), dtype=np.int64)
+    np.maximum.at(last, tp, np.arange(len(tp)))
+    present = last[types][None, :] >= np.arange(len(r))[:, None]
+    cost = np.where(present, into[types][None, :], 0)
+    setup = cost.sum(axis=1) - cost.max(axis=1)
+
+    return {'release': int((arrivet + processt).max()),
+            'preemptive': int((r + work).max()),
+            'setup': int(r[0] + work[0] + setup[0]),
+            'preemptive_setup': int((r + work + setup).max())}
+
+
+def lower_bound(lots, ttmatrix, release=None):
+    return max(lower_bounds(lots, ttmatrix, release).values())
+
+
+def get_gap(objv, bound):
+    """Relative gap (objv - bound) / objv, None without a solution."""
+    if objv is None or bound is None:
+        return None
+    if objv <= 0:
+        return 0.0
+    return max(objv - bound, 0) / objv
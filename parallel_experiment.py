@@ -0,0 +1,116 @@
+"""Run (solver, instance, seed, time limit) experiment jobs in a process pool and resume unfinished sweeps."""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from engines import get_engine
+from instance_io import instance_path, load_instance
+from solve_trace import traced_solve
+
+SIZES = list(range(2, 10)) + list(range(10, 100, 10)) + list(range(100, 501, 50))
+
+
+def job_key(job):
+    return job['solver'], job['size'], job['seed'], job['time_limit']
+
+
+def trace_path(job):
+    return os.path.join(job['trace_dir'], '%s_%i_%i_%g.npz' % job_key(job))
+
+
+def run_job(job):
+    """Solve one instance in a worker process and return the job with its result fields.
+    The incumbent trace is saved to trace_dir if the job has one."""
+    path = instance_path(job['data_dir'], job['size'])
+    lots, ttmatrix = load_instance(path)
+    mdl = get_engine(job['solver'])(lots, ttmatrix)
+    mdl.build_model()
+    mdl.set_solve_time(job['time_limit'])
+    if hasattr(mdl, 'set_num_workers'):
+        mdl.set_num_workers(job['workers'])
+    if hasattr(mdl, 'set_random_seed'):
+        mdl.set_random_seed(job['seed'])
+    trace = traced_solve(mdl, job['solver'], path)
+    if job.get('trace_dir'):
+        trace.save(trace_path(job))
+
+    result = dict(job)
+    result.update(time=mdl.get_solve_time(),
+                  objv=mdl.get_objective_value(),
+                  status=mdl.get_solve_status(),
+                  bound=mdl.get_lower_bound(),
+                  gap=mdl.get_gap())
+    return result
+
+
+class ParallelExperiment:
+    """processes * workers_per_job should not exceed the cores of the machine,
+    every CP-SAT / SCIP / COPT job starts workers_per_job search threads of its own."""
+
+    def __init__(self, result_file='data/sweep.jsonl', data_dir='data', processes=None, workers_per_job=1,
+                 trace_dir=None):
+        self.result_file = result_file
+        self.data_dir = data_dir
+        self.trace_dir = trace_dir
+        self.workers_per_job = workers_per_job
+        self.processes = processes or max(1, (os.cpu_count() or 1) // workers_per_job)
+
+    def make_jobs(self, solvers, sizes=SIZES, seeds=(0,), time_limit=300):
+        return [{'solver': solver, 'size': size, 'seed': seed, 'time_limit': time_limit,
+                 'workers': self.workers_per_job, 'data_dir': self.data_dir, 'trace_dir': self.trace_dir}
+                for solver in solvers for size in sizes for seed in seeds]
+
+    def load_results(self):
+        if not os.path.exists(self.result_file):
+            return []
+        with open(self.result_file) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def run(self, jobs):
+        """Solve every job without a stored result, appending each result to result_file as it finishes."""
+        finished = {job_key(r) for r in self.load_results()}
+        todo = [job for job in jobs if job_key(job) not in finished]
+        print('%i jobs, %i finished, %i to run on %i processes' % (len(jobs), len(jobs) - len(todo), len(todo),
+                                                                   self.processes))
+
+        if self.trace_dir:
+            os.makedirs(self.trace_dir, exist_ok=True)
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.processes) as pool, open(self.result_file, 'a') as f:
+            futures = {pool.submit(run_job, job): job for job in todo}
+            for count, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print('%s size %i seed %i failed: %r' % (job['solver'], job['size'], job['seed'], e))
+                    continue
+                f.write(json.dumps(result) + '\n')
+                f.flush()
+                print('[%i/%i %.0fs] %s size %i seed %i: %s %s' % (count, len(todo), time.perf_counter() - start,
+                                                                   result['solver'], result['size'],
+                                                                   result['seed'], result['status'],
+                                                                   result['objv']))
+        return self.load_results()
+
+    def save_xls(self, solver, filename):
+        """Write the stored results of one solver in the size/time/objv/status layout of experiment.py."""
+        import xlwt
+
+        results = sorted((r for r in self.load_results() if r['solver'] == solver),
+                         key=lambda r: (r['size'], r['seed'], r['time_limit']))
+        wbook = xlwt.Workbook()
+        wtable = wbook.add_sheet('%s_experiment' % solver)
+        for col, name in enumerate(('size', 'seed', 'time_limit', 'time', 'objv', 'status', 'bound', 'gap')):
+            wtable.write(0, col, name)
+            for row, r in enumerate(results, 1):
+                wtable.write(row, col, r.get(name))
+        wbook.save(filename)
+
+
+if __name__ == '__main__':
+    exp = ParallelExperiment(workers_per_job=2, trace_dir='data/traces')
+    exp.run(exp.make_jobs(('cp', 'lp'), time_limit=300))
+    exp.save_xls('cp', 'data/result.xls')
+    exp.save_xls('lp', 'data/result1.xls')
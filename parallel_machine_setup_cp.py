@@ -0,0 +1,248 @@
+"""Minimize the makespan of lots on parallel machines with machine-specific processing and setup times."""
+import math
+import time
+
+import numpy as np
+
+from Lot import lot_arrays
+from schedule_check import check_schedule
+from graph import parallel_machine_setup_gantt
+import single_machine_setup_cp as cp
+
+
+def machine_data(lots, ttmatrix, nmachine, processt=None):
+    """Return (pmat, setups): pmat[i][k] the processing time of lot i on machine k, -1 if it cannot
+    run there, setups[k] the setup matrix of machine k. ttmatrix is one matrix shared by all machines
+    or one matrix per machine; processt is None (lot.processt everywhere) or an nlot x nmachine table
+    with None for machines a lot cannot use."""
+    if processt is None:
+        pmat = np.repeat(lot_arrays(lots)[1][:, None], nmachine, axis=1)
+    else:
+        pmat = np.array([[-1 if p is None else p for p in row] for row in processt], dtype=np.int64)
+    if (pmat.max(axis=1) < 0).any():
+        raise ValueError('Every lot needs at least one machine')
+
+    setups = np.asarray(ttmatrix, dtype=np.int64)
+    if setups.ndim == 2:
+        setups = np.repeat(setups[None, :, :], nmachine, axis=0)
+    return pmat, setups
+
+
+def parallel_dispatch(arrivet, ltype, pmat, setups):
+    """Greedy list schedule: lots in arrival order, each on the machine where it finishes first,
+    with the setup from the previous lot on that machine. Return (machine, startt) arrays."""
+    nlot, nmachine = pmat.shape
+    free = np.zeros(nmachine, dtype=np.int64)
+    last = np.full(nmachine, -1, dtype=np.int64)
+    machine = np.zeros(nlot, dtype=np.int64)
+    startt = np.zeros(nlot, dtype=np.int64)
+    machines = np.arange(nmachine)
+
+    for i in np.lexsort((np.arange(nlot), arrivet)).tolist():
+        setup = np.where(last >= 0, setups[machines, np.maximum(last, 0), ltype[i]], 0)
+        start = np.maximum(arrivet[i], free + setup)
+        end = np.where(pmat[i] >= 0, start + pmat[i], np.iinfo(np.int64).max)
+        k = int(end.argmin())
+        machine[i], startt[i] = k, start[k]
+        free[k], last[k] = end[k], ltype[i]
+    return machine, startt
+
+
+class ParallelSetupOrtoolsCP(cp.SingleSetupOrtoolsCP):
+    """Every lot picks one machine through an optional interval per eligible machine. Machines keep
+    their own AddNoOverlap and an AddCircuit over successor arcs, with the setup of machine k between
+    adjacent lots. window: None for every arc, else only arcs between lots at most window positions
+    apart in arrival order, plus the arcs of the hint; this keeps 20 machines x 1k lots buildable and
+    the hint feasible, but can cut off the optimum."""
+
+    def __init__(self, lots, ttmatrix, nmachine, processt=None, window=None):
+        super().__init__(lots, ttmatrix)
+        self.nmachine = nmachine
+        self.window = window
+        self.pmat, self.setups = machine_data(lots, ttmatrix, nmachine, processt)
+        self.presence = None
+        self.end = None
+
+    def get_hint(self):
+        """{lot idx: (machine, start time)} of the greedy list schedule."""
+        arrivet, _, ltype = lot_arrays(self.lots)
+        machine, startt = parallel_dispatch(arrivet, ltype, self.pmat, self.setups)
+        return {lot.idx: (int(machine[i]), int(startt[i])) for i, lot in enumerate(self.lots)}
+
+    def hint_feasible(self, hint):
+        """True if every lot of hint is on an eligible machine and every machine sequence passes
+        check_schedule with the adjacent setups of that machine."""
+        arrivet, _, ltype = lot_arrays(self.lots)
+        machine = np.array([hint[lot.idx][0] for lot in self.lots], dtype=np.int64)
+        startt = np.array([hint[lot.idx][1] for lot in self.lots], dtype=np.float64)
+        if ((machine < 0) | (machine >= self.nmachine)).any():
+            return False
+        processt = self.pmat[np.arange(self.nlot), machine]
+        if (processt < 0).any():
+            return False
+        for k in range(self.nmachine):
+            on = np.flatnonzero(machine == k)
+            if not check_schedule(arrivet[on], processt[on], ltype[on], startt[on], self.setups[k],
+                                  adjacent=True)['feasible']:
+                return False
+        return True
+
+    def calculate_bounds(self, schedule):
+        """Horizon: all lots one after the other behind the last arrival, with the longest eligible
+        processing and largest setup each, or the makespan of schedule, a feasible hint, if smaller.
+        Lower bound: the longest release + shortest processing, and the shortest total work spread
+        over all machines."""
+        arrivet = lot_arrays(self.lots)[0]
+        pmax = self.pmat.max(axis=1)
+        pmin = np.where(self.pmat >= 0, self.pmat, pmax[:, None]).min(axis=1)
+        horizon = int(arrivet.max() + (pmax + self.setups.max()).sum())
+        schedule_end = max(st + self.pmat[i, k] for i, (k, st) in enumerate(schedule[lot.idx] for lot in self.lots))
+        horizon = min(horizon, int(math.ceil(schedule_end)))
+        lower = max(int((arrivet + pmin).max()), int(arrivet.min() + math.ceil(pmin.sum() / self.nmachine)))
+        return horizon, lower, pmin
+
+    def add_machine_circuit(self, k, presence, hint_arcs):
+        model = self.model
+        t, end = self.t, self.end
+        ltype = [lot.ltype for lot in self.lots]
+        setup = self.setups[k].tolist()
+        rank = np.empty(self.nlot, dtype=np.int64)
+        rank[np.argsort(lot_arrays(self.lots)[0], kind='stable')] = np.arange(self.nlot)
+        rank = rank.tolist()
+
+        # node nlot is the depot, a self loop on a lot skips it on this machine
+        depot = self.nlot
+        nodes = [i for i in range(self.nlot) if (i, k) in presence]
+        arcs = [(depot, depot, model.NewBoolVar('empty_%i' % k))]
+        for i in nodes:
+            arcs.append((i, i, presence[i, k].Not()))
+            arcs.append((depot, i, model.NewBoolVar('start_%i_%i' % (i, k))))
+            arcs.append((i, depot, model.NewBoolVar('end_%i_%i' % (i, k))))
+            for j in nodes:
+                if i == j:
+                    continue
+                if self.window is not None and abs(rank[i] - rank[j]) > self.window and (i, j) not in hint_arcs:
+                    continue
+                l_ij = model.NewBoolVar('l_%i_%i_%i' % (i, j, k))  # successor on machine k: i -> j
+                model.Add(end[i] + setup[ltype[i]][ltype[j]] <= t[j]).OnlyEnforceIf(l_ij)
+                arcs.append((i, j, l_ij))
+        model.AddCircuit(arcs)
+        return arcs
+
+    def add_hint(self, hint):
+        model = self.model
+        for i, lot in enumerate(self.lots):
+            k, st = hint[lot.idx]
+            model.AddHint(self.t[i], st)
+            model.AddHint(self.end[i], st + int(self.pmat[i, k]))
+        for (i, k), a_ik in self.presence.items():
+            model.AddHint(a_ik, hint[self.lots[i].idx][0] == k)
+        model.AddHint(self.obj, max(st + int(self.pmat[i, k]) for i, (k, st) in
+                                    enumerate(hint[lot.idx] for lot in self.lots)))
+
+        depot = self.nlot
+        for k, seq in enumerate(self.hint_sequences(hint)):
+            succ = dict(zip([depot] + seq, seq + [depot]))
+            for i, j, literal in self.arcs[k]:
+                if i != j:
+                    model.AddHint(literal, succ.get(i) == j)
+                elif i == depot:
+                    model.AddHint(literal, not seq)
+                # the self loop of a lot is its negated presence, hinted above
+
+    def hint_sequences(self, hint):
+        """Lot positions on every machine in hinted start order."""
+        seqs = [[] for _ in range(self.nmachine)]
+        for i in sorted(range(self.nlot), key=lambda i: hint[self.lots[i].idx][1]):
+            seqs[hint[self.lots[i].idx][0]].append(i)
+        return seqs
+
+    def build_model(self, initial_schedule=None):
+        """initial_schedule: optional {lot idx: (machine, start time)}, the greedy list schedule by default.
+        The horizon and the window arcs come from initial_schedule only if it passes hint_feasible,
+        otherwise from the greedy list schedule and initial_schedule is only a hint."""
+        start = time.perf_counter()
+        lots = self.lots
+        model = self.model
+        nlot = self.nlot
+        profile = self.profile
+
+        with profile.phase('bounds'):
+            hint = initial_schedule if initial_schedule is not None else self.get_hint()
+            # the schedule that bounds the horizon and keeps the window feasible
+            feasible = hint if initial_schedule is None or self.hint_feasible(hint) else self.get_hint()
+            horizon, self.lower_bound, pmin = self.calculate_bounds(feasible)
+            self.horizon = horizon
+
+        with profile.phase('variables'):
+            obj = model.NewIntVar(self.lower_bound, horizon, 'obj')
+            t = [model.NewIntVar(lot.arrivet, horizon - int(pmin[i]), 't_%i' % lot.idx) for i, lot in enumerate(lots)]
+            end = [model.NewIntVar(lot.arrivet + int(pmin[i]), horizon, 'e_%i' % lot.idx)
+                   for i, lot in enumerate(lots)]
+            presence = {}
+            intervals = [[] for _ in range(self.nmachine)]
+            for i in range(nlot):
+                for k in np.flatnonzero(self.pmat[i] >= 0).tolist():
+                    a_ik = model.NewBoolVar('a_%i_%i' % (i, k))  # lot i runs on machine k
+                    intervals[k].append(model.NewOptionalIntervalVar(t[i], int(self.pmat[i, k]), end[i], a_ik,
+                                                                     'interval_%i_%i' % (i, k)))
+                    presence[i, k] = a_ik
+        self.t, self.end, self.obj, self.presence = t, end, obj, presence
+
+        with profile.phase('objective'):
+            for i in range(nlot):
+                model.AddExactlyOne(presence[i, k] for k in range(self.nmachine) if (i, k) in presence)
+                model.Add(obj >= end[i])
+            for k in range(self.nmachine):
+                model.AddNoOverlap(intervals[k])
+
+        with profile.phase('setup'):
+            seqs = self.hint_sequences(feasible)
+            self.arcs = [self.add_machine_circuit(k, presence, set(zip(seq, seq[1:]))) for k, seq in enumerate(seqs)]
+
+        with profile.phase('hint'):
+            self.add_hint(hint)
+
+        model.Minimize(obj)
+        self.build_time = time.perf_counter() - start
+        profile.counts['nvariables'], profile.counts['nconstraints'] = self.get_model_size()
+
+    def save_result(self):
+        solver = self.solver
+        for i, lot in enumerate(self.lots):
+            lot.startt = solver.Value(self.t[i])
+            lot.machine = next(k for k in range(self.nmachine)
+                               if (i, k) in self.presence and solver.Value(self.presence[i, k]))
+        self.objv = solver.Value(self.obj)
+
+    def get_assignment(self):
+        """{lot idx: (machine, start time)}, the format of initial_schedule."""
+        return {lot.idx: (lot.machine, lot.startt) for lot in self.lots}
+
+    def get_durations(self):
+        return {lot.idx: int(self.pmat[i, lot.machine]) for i, lot in enumerate(self.lots)}
+
+    def show_solve_status_and_result(self):
+        print('Solution Status: ' + self.get_solve_status())
+        if self.has_solution():
+            durations = self.get_durations()
+            for k in range(self.nmachine):
+                row = sorted((lot for lot in self.lots if lot.machine == k), key=lambda lot: lot.startt)
+                print('Machine %i: ' % k + ' '.join('lot_%i:t%i[%i->%i]' % (lot.idx, lot.ltype, lot.startt,
+                                                                            lot.startt + durations[lot.idx])
+                                                     for lot in row))
+            print('Optimal Objective: %s' % self.objv)
+
+    def show_gantt_chart(self, path=None):
+        if self.has_solution():
+            parallel_machine_setup_gantt(self.lots, self.setups.tolist(), self.get_durations(), path)
+        else:
+            print('No gantt chart to show!')
+
+
+if __name__ == '__main__':
+    lots1 = cp.create_lots_from_tuplelist(cp.lot_data)
+    # machine 1 is slower by one time unit and cannot run type 2 lots
+    processt1 = [[lot.processt, None if lot.ltype == 2 else lot.processt + 1] for lot in lots1]
+    psp = ParallelSetupOrtoolsCP(lots1, cp.type_transform_matrix, nmachine=2, processt=processt1)
+    psp.main()
@@ -0,0 +1,181 @@
+"""Race several engines on one instance in worker processes and stop at the first proof or at a deadline.
+
+    race = PortfolioRace(lots, ttmatrix, engines=('cp', 'lp', 'copt'))
+    async for event in race.events(deadline=60):   # incumbent improvements as they are found
+        print(event)
+    race.best                                      # best solution found, with engine and startt
+
+CP-SAT and COPT report every new solution from a solution callback, SCIP through pywraplp has no
+callback and only reports its final result. The race ends when an engine proves optimality, when an
+incumbent reaches the instance lower bound, when every engine has finished or when the deadline
+passes; the engines still running are terminated.
+"""
+import asyncio
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+
+from Lot import lot_arrays
+from lower_bound import lower_bound
+from engines import get_engine
+from schedule_check import check_schedule, repair_schedule
+import single_machine_setup_cp as cp
+
+POLL = 0.05  # [s] between checks of the result queue
+
+
+def _cp_callback(t, report):
+    from ortools.sat.python import cp_model
+
+    class Incumbents(cp_model.CpSolverSolutionCallback):
+        def on_solution_callback(self):
+            report(self.ObjectiveValue(), self.BestObjectiveBound(), [self.Value(v) for v in t])
+
+    return Incumbents()
+
+
+def _copt_callback(t, lots, ttmatrix, report):
+    """COPT incumbents are floats within the solver tolerances: they are repaired to exact integer start
+    times and reported with the repaired makespan, only if the result passes check_schedule."""
+    from coptpy import COPT, CallbackBase
+    arrivet, processt, ltype = lot_arrays(lots)
+
+    class Incumbents(CallbackBase):
+        def callback(self):
+            if self.where() == COPT.CBCONTEXT_MIPSOL:
+                startt = repair_schedule(arrivet, processt, ltype,
+                                         np.asarray(self.getSolution([t[i] for i in range(len(t))])), ttmatrix)
+                if check_schedule(arrivet, processt, ltype, startt, ttmatrix)['feasible']:
+                    report(int((startt + processt).max()), self.getInfo(COPT.CBInfo.BestBnd), startt.tolist())
+
+    return Incumbents()
+
+
+def solve_worker(engine, rows, ttmatrix, time_limit, workers, results):
+    """Solve in a worker process, put ('incumbent' | 'done' | 'error', engine, data) on results."""
+    start = time.perf_counter()
+
+    def report(objv, bound, startt):
+        results.put(('incumbent', engine, {'objv': objv, 'bound': bound, 'startt': startt,
+                                           'time': time.perf_counter() - start}))
+
+    try:
+        lots = cp.create_lots_from_tuplelist(rows)
+        mdl = get_engine(engine)(lots, ttmatrix)
+        mdl.build_model()
+        mdl.set_solve_time(time_limit)
+        if hasattr(mdl, 'set_num_workers'):
+            mdl.set_num_workers(workers)
+        if engine == 'cp':
+            mdl.solve(_cp_callback(mdl.t, report))
+        elif engine == 'copt':
+            mdl.solve(_copt_callback(mdl.t, lots, ttmatrix, report))
+        else:
+            mdl.solve()
+
+        startt = None
+        if mdl.has_solution():
+            schedule = cp.get_schedule(lots)
+            startt = [schedule[i] for i in range(len(lots))]
+        results.put(('done', engine, {'status': mdl.get_solve_status(), 'objv': mdl.get_objective_value(),
+                                      'bound': mdl.get_lower_bound(), 'startt': startt,
+                                      'time': time.perf_counter() - start}))
+    except Exception as e:
+        results.put(('error', engine, {'error': '%s: %s' % (type(e).__name__, e)}))
+
+
+class PortfolioRace:
+    """workers_per_engine: search threads of every engine, the race starts len(engines) processes."""
+
+    def __init__(self, lots, ttmatrix, engines=('cp', 'lp', 'copt'), workers_per_engine=1):
+        self.rows = [(lot.arrivet, lot.processt, lot.ltype) for lot in sorted(lots, key=lambda lot: lot.idx)]
+        self.ttmatrix = [list(map(int, row)) for row in ttmatrix]
+        self.engines = engines
+        self.workers_per_engine = workers_per_engine
+        self.lower_bound = lower_bound(lots, ttmatrix)
+
+        self.processes = {}
+        self.results = None
+        self.best = None
+        self.bound = self.lower_bound
+        self.finished = {}
+
+    def start(self, time_limit):
+        self.results = multiprocessing.Queue()
+        for engine in self.engines:
+            p = multiprocessing.Process(target=solve_worker, daemon=True,
+                                        args=(engine, self.rows, self.ttmatrix, time_limit,
+                                              self.workers_per_engine, self.results))
+            p.start()
+            self.processes[engine] = p
+
+    def cancel(self):
+        for p in self.processes.values():
+            if p.is_alive():
+                p.terminate()
+        for p in self.processes.values():
+            p.join()
+        self.processes = {}
+
+    def get_result(self):
+        try:
+            return self.results.get(timeout=POLL)
+        except queue.Empty:
+            return None
+
+    def update(self, kind, engine, data):
+        """Fold a worker message into best, bound and finished, return True if it improved best."""
+        if kind != 'incumbent':
+            self.finished[engine] = data
+        if data.get('bound') is not None:
+            self.bound = max(self.bound, data['bound'])
+        if data.get('objv') is None or data.get('startt') is None:
+            return False
+        if self.best is None or data['objv'] < self.best['objv']:
+            self.best = dict(data, engine=engine)
+            return True
+        return False
+
+    def is_proven(self):
+        if any(data.get('status') == 'OPTIMAL' for data in self.finished.values()):
+            return True
+        return self.best is not None and self.best['objv'] <= self.bound + 1e-6
+
+    async def events(self, deadline=60):
+        """Yield {'event', 'engine', ...} for every improving incumbent, final and error message."""
+        loop = asyncio.get_running_loop()
+        end = time.perf_counter() + deadline
+        self.start(deadline)
+        try:
+            while len(self.finished) < len(self.engines) and time.perf_counter() < end:
+                msg = await loop.run_in_executor(None, self.get_result)
+                if msg is None:
+                    continue
+                kind, engine, data = msg
+                improved = self.update(kind, engine, data)
+                if improved or kind != 'incumbent':
+                    yield dict(data, event=kind, engine=engine)
+                if self.is_proven():
+                    break
+        finally:
+            self.cancel()
+
+    async def solve(self, deadline=60, on_incumbent=None):
+        """Run the race to its end, return the best solution. on_incumbent is called with every event."""
+        async for event in self.events(deadline):
+            if on_incumbent is not None:
+                on_incumbent(event)
+        return self.best
+
+
+def race(lots, ttmatrix, engines=('cp', 'lp', 'copt'), deadline=60, on_incumbent=None):
+    """Blocking wrapper around PortfolioRace.solve for callers without an event loop."""
+    return asyncio.run(PortfolioRace(lots, ttmatrix, engines).solve(deadline, on_incumbent))
+
+
+if __name__ == '__main__':
+    lots1 = cp.create_lots_from_tuplelist(cp.lot_data)
+    best = race(lots1, cp.type_transform_matrix, deadline=10, on_incumbent=print)
+    print('best: %s' % best)
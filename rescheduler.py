@@ -0,0 +1,178 @@
+"""Keep one live CP-SAT model while lots keep arriving and re-solve only the open tail."""
+import numpy as np
+from ortools.sat.python import cp_model
+
+from bounds import InstanceBounds
+from single_machine_setup_heuristic import heuristic_schedule
+import single_machine_setup_cp as cp
+
+
+class IncrementalScheduler:
+    """add_lots appends variables and pairwise setup constraints for the new lots only. Lots that have
+    started are frozen in place: their start and their precedences to the open lots are fixed by
+    domain changes, and their per-type ready times become lower bounds of the open lots, so no new
+    constraints are created against them. Only the open lots are tracked, the last frozen lot is
+    kept as the machine state. reoptimize hints the previous solution and re-solves the same model."""
+
+    def __init__(self, ttmatrix):
+        self.ttmatrix = ttmatrix
+        self.tt = np.asarray(ttmatrix, dtype=np.int64)
+
+        self.model = cp_model.CpModel()
+        self.solver = cp_model.CpSolver()
+        self.lots = {}  # position -> lot, open lots only
+        self.t = {}
+        self.x = {}  # precedence bools between open lots
+        self.obj = self.model.NewIntVar(0, 0, 'obj')
+        self.model.Minimize(self.obj)
+        self.horizon = 0
+        self.nlot = 0  # lots added so far, the position of the next one
+        self.nfrozen = 0
+        self.last = None  # last frozen lot
+        self.type_ready = np.zeros(len(self.tt), dtype=np.int64)
+        self.now = 0
+        self.solution = {}  # position -> start time of the open lots
+        self.status = None
+        self.objv = None
+
+    def frozen_end(self):
+        return 0 if self.last is None else self.last.startt + self.last.processt
+
+    def earliest_start(self, i):
+        lot = self.lots[i]
+        return max(lot.arrivet, self.now, int(self.type_ready[lot.ltype]))
+
+    def update_horizon(self):
+        """Grow the horizon to cover the open lots after the frozen ones and widen the domains."""
+        bounds = InstanceBounds(list(self.lots.values()), self.ttmatrix, [self.earliest_start(i) for i in self.lots])
+        self.horizon = max(self.horizon, bounds.horizon, self.frozen_end())
+        for i, lot in self.lots.items():
+            cp.set_domain(self.model, self.t[i], self.earliest_start(i), self.horizon - lot.processt)
+        cp.set_domain(self.model, self.obj, self.frozen_end(), self.horizon)
+
+    def add_lots(self, new_lots, now):
+        """Add new_lots at now, return their positions."""
+        model = self.model
+        self.now = max(self.now, now)
+
+        first = self.nlot
+        for lot in new_lots:
+            i = self.nlot
+            self.nlot += 1
+            self.t[i] = model.NewIntVar(0, 0, 't_%i' % lot.idx)
+            model.Add(self.obj >= self.t[i] + lot.processt)
+
+            for j, other in self.lots.items():
+                x_ji = model.NewBoolVar('x_%i_%i' % (j, i))  # precedence: j -> i
+                tji = int(self.tt[other.ltype][lot.ltype])
+                tij = int(self.tt[lot.ltype][other.ltype])
+                model.Add(self.t[j] + other.processt + tji <= self.t[i]).OnlyEnforceIf(x_ji)
+                model.Add(self.t[i] + lot.processt + tij <= self.t[j]).OnlyEnforceIf(x_ji.Not())
+                self.x[j, i] = x_ji
+            self.lots[i] = lot
+
+        self.update_horizon()
+        return list(range(first, self.nlot))
+
+    def freeze_before(self, now):
+        """Fix every lot that starts before now in place, later lots may not start before now either.
+        Return the frozen lots in start order."""
+        self.now = max(self.now, now)
+        started = sorted((i for i in self.lots if i in self.solution and self.solution[i] < self.now),
+                         key=lambda i: self.solution[i])
+        starts = {}
+        frozen = []
+        for i in started:
+            starts[i] = st = self.solution.pop(i)
+            lot = self.lots.pop(i)
+            cp.set_domain(self.model, self.t.pop(i), st, st)
+            np.maximum(self.type_ready, st + lot.processt + self.tt[lot.ltype], out=self.type_ready)
+            frozen.append(lot)
+        if frozen:
+            self.last = frozen[-1]
+        self.nfrozen += len(frozen)
+
+        # pin the precedences of the frozen lots, a frozen lot starts before every open lot
+        for i, j in [pair for pair in self.x if pair[0] in starts or pair[1] in starts]:
+            before = int(starts[i] < starts[j]) if i in starts and j in starts else int(i in starts)
+            cp.set_domain(self.model, self.x.pop((i, j)), before, before)
+        self.update_horizon()
+        return frozen
+
+    def add_hint(self):
+        """Keep the previous starts of the open lots and append lots without one by dispatching,
+        unless dispatching all open lots from the frozen state gives a shorter schedule."""
+        planned = [i for i in self.lots if i in self.solution]
+        unplanned = [i for i in self.lots if i not in self.solution]
+
+        ready = np.maximum(self.type_ready, self.now)
+        for i in sorted(planned, key=lambda i: self.solution[i]):
+            lot = self.lots[i]
+            np.maximum(ready, self.solution[i] + lot.processt + self.tt[lot.ltype], out=ready)
+        appended = heuristic_schedule([self.lots[i] for i in unplanned], self.ttmatrix, type_ready=ready)
+        hint = {i: self.solution[i] for i in planned}
+        hint.update({i: appended[self.lots[i].idx] for i in unplanned})
+
+        start = np.maximum(self.type_ready, self.now)
+        redispatched = heuristic_schedule(list(self.lots.values()), self.ttmatrix, type_ready=start)
+        redispatched = {i: redispatched[lot.idx] for i, lot in self.lots.items()}
+
+        def makespan(schedule):
+            return max([schedule[i] + self.lots[i].processt for i in schedule] + [self.frozen_end()])
+
+        if makespan(redispatched) < makespan(hint):
+            hint = redispatched
+
+        model = self.model
+        model.ClearHints()
+        for i, st in hint.items():
+            model.AddHint(self.t[i], st)
+        for (i, j), x_ij in self.x.items():
+            model.AddHint(x_ij, hint[i] < hint[j])
+        model.AddHint(self.obj, makespan(hint))
+
+    def reoptimize(self, time_budget=0.5):
+        self.add_hint()
+        self.solver.parameters.max_time_in_seconds = time_budget
+        self.status = self.solver.Solve(self.model)
+        if self.has_solution():
+            self.save_result()
+        return self.get_solve_status()
+
+    def save_result(self):
+        for i, lot in self.lots.items():
+            self.solution[i] = self.solver.Value(self.t[i])
+            lot.startt = self.solution[i]
+        self.objv = self.solver.Value(self.obj)
+
+    def has_solution(self):
+        return self.get_solve_status() in ('OPTIMAL', 'FEASIBLE')
+
+    def get_solve_status(self):
+        if self.status == cp_model.OPTIMAL:
+            return 'OPTIMAL'
+        if self.status == cp_model.FEASIBLE:
+            return 'FEASIBLE'
+        if self.status == cp_model.INFEASIBLE:
+            return 'INFEASIBLE'
+        if self.status == cp_model.MODEL_INVALID:
+            return 'MODEL_INVALID'
+        return 'UNKNOWN'
+
+    def get_objective_value(self):
+        return self.objv
+
+    def get_schedule(self):
+        """{lot idx: start time} of the open lots, frozen lots keep the start they were frozen with."""
+        return cp.get_schedule(self.lots.values())
+
+
+if __name__ == '__main__':
+    lots1 = cp.create_lots_from_tuplelist(cp.lot_data)
+    scheduler = IncrementalScheduler(cp.type_transform_matrix)
+    # lots become known at their arrival time
+    for now in sorted({lot.arrivet for lot in lots1}):
+        scheduler.freeze_before(now)
+        scheduler.add_lots([lot for lot in lots1 if lot.arrivet == now], now)
+        print('t=%i: %s, %i open' % (now, scheduler.reoptimize(0.5), len(scheduler.lots)))
+    cp.print_lot_schedule(sorted(lots1, key=lambda lot: lot.startt), scheduler.get_objective_value())
@@ -0,0 +1,169 @@
+"""Schedule large lot sets window by window with SingleSetupOrtoolsCP and stitch the windows together."""
+import time
+
+import numpy as np
+
+from graph import single_machine_setup_gantt
+from Lot import lot_arrays
+from schedule_check import repair_schedule
+from single_machine_setup_heuristic import heuristic_schedule
+import single_machine_setup_cp as cp
+
+
+class RollingHorizonScheduler:
+    """Lots are taken in the order of the dispatching schedule of rule over all lots, which follows
+    the arrivals but sees the whole queue of released lots. Every window holds the lots left
+    uncommitted by the previous window plus the next lots of that order, up to window lots, and is
+    hinted with them in that order. After a window is solved the first commit lots of its sequence
+    are fixed, and their per-type ready times become the state of the next window.
+
+    objective: 'completion' minimizes the window makespan first and the sum of start times second in
+    every window but the last, so the solver has no reason to delay the lots it then commits;
+    'makespan' minimizes the window makespan alone. The stitched schedule is replaced by the
+    dispatching schedule when that one is shorter."""
+
+    objectives = ('completion', 'makespan')
+
+    def __init__(self, lots, ttmatrix, window=40, commit=25, solvetime=2, formulation='pairwise',
+                 objective='completion', rule='setup'):
+        if not 0 < commit <= window:
+            raise ValueError('commit must be in (0, window]')
+        if objective not in self.objectives:
+            raise ValueError('Unknown objective: %s' % objective)
+
+        self.lots = lots
+        self.ttmatrix = ttmatrix
+        self.nlot = len(lots)
+        self.window = window
+        self.commit = commit
+        self.solvetime = solvetime
+        self.formulation = formulation
+        self.objective = objective
+        self.rule = rule
+
+        self.tt = np.asarray(ttmatrix, dtype=np.int64)
+        self.type_ready = None
+        self.nwindow = 0
+        self.dispatched = None
+        self.fallback = False
+        self.status = None
+        self.objv = None
+        self.solve_time = None
+
+    def window_hint(self, window_lots):
+        """The dispatching order of window_lots, retimed from the machine state."""
+        arrivet, processt, ltype = lot_arrays(window_lots)
+        earliest = np.maximum(arrivet, self.type_ready[ltype])
+        order = np.array([self.dispatched[lot.idx] for lot in window_lots])
+        startt = repair_schedule(earliest, processt, ltype, order, self.ttmatrix)
+        return {lot.idx: st for lot, st in zip(window_lots, startt.tolist())}
+
+    def solve_window(self, window_lots, last=False):
+        """Set startt of window_lots, from CP-SAT when it finds a solution, else from the hint.
+        The last window is not cut, it minimizes its makespan."""
+        hint = self.window_hint(window_lots)
+        mdl = cp.SingleSetupOrtoolsCP(list(window_lots), self.ttmatrix, self.formulation)
+        mdl.set_machine_state(self.type_ready)
+        mdl.build_model(initial_schedule=hint)
+        if self.objective == 'completion' and not last:
+            # makespan first, then the sum of start times
+            model = mdl.model
+            model.Minimize(mdl.obj * (len(window_lots) * mdl.horizon + 1) + sum(mdl.t))
+        mdl.set_solve_time(self.solvetime)
+        mdl.solve()
+        if not mdl.has_solution():
+            for lot in window_lots:
+                lot.startt = hint[lot.idx]
+        return sorted(window_lots, key=lambda lot: lot.startt)
+
+    def commit_lots(self, lots):
+        for lot in lots:
+            end = lot.startt + lot.processt
+            np.maximum(self.type_ready, end + self.tt[lot.ltype], out=self.type_ready)
+
+    def solve(self):
+        start = time.perf_counter()
+        self.dispatched = heuristic_schedule(self.lots, self.ttmatrix, self.rule)
+        order = sorted(self.lots, key=lambda lot: (self.dispatched[lot.idx], lot.idx))
+        self.type_ready = np.zeros(len(self.tt), dtype=np.int64)
+        self.nwindow = 0
+
+        pending = []
+        pos = 0
+        while pos < self.nlot or pending:
+            take = self.window - len(pending)
+            window_lots = pending + order[pos:pos + take]
+            pos += take
+            seq = self.solve_window(window_lots, last=pos >= self.nlot)
+            self.nwindow += 1
+
+            ncommit = len(seq) if pos >= self.nlot else self.commit
+            self.commit_lots(seq[:ncommit])
+            pending = seq[ncommit:]
+
+        self.keep_better_dispatch()
+        self.solve_time = time.perf_counter() - start
+        self.status = 'FEASIBLE' if self.nlot else 'NOT_SOLVED'
+        if self.has_solution():
+            self.save_result()
+
+    def keep_better_dispatch(self):
+        """Use the dispatching schedule of all lots if it ends before the stitched one."""
+        dispatched = self.dispatched
+        stitched = max((lot.startt + lot.processt for lot in self.lots), default=0)
+        self.fallback = max((dispatched[lot.idx] + lot.processt for lot in self.lots), default=0) < stitched
+        if self.fallback:
+            for lot in self.lots:
+                lot.startt = dispatched[lot.idx]
+
+    def save_result(self):
+        self.objv = max(lot.startt + lot.processt for lot in self.lots)
+        # sort lots by sequence
+        self.lots.sort(key=lambda lot: lot.startt)
+
+    def print_status_result_statistics(self):
+        self.show_solve_status_and_result()
+        self.show_solve_statistics()
+
+    def has_solution(self):
+        return self.get_solve_status() == 'FEASIBLE'
+
+    def show_solve_status_and_result(self):
+        print('Solution Status: ' + self.get_solve_status())
+        if self.has_solution():
+            cp.print_lot_schedule(self.lots, self.objv)
+
+    def show_solve_statistics(self):
+        print('Statistics')
+        print('  - windows  : %i' % self.nwindow)
+        if self.fallback:
+            print('  - kept the %s dispatching schedule' % self.rule)
+        print('  - wall time: %f s' % self.solve_time)
+
+    def show_gantt_chart(self, path=None):
+        if self.has_solution():
+            single_machine_setup_gantt(self.lots, self.ttmatrix, path)
+        else:
+            print('No gantt chart to show!')
+
+    def get_solve_status(self):
+        return self.status or 'NOT_SOLVED'
+
+    def get_solve_time(self):
+        return self.solve_time
+
+    def get_objective_value(self):
+        return self.objv
+
+    def main(self, solvetime=None, gantt_file=None):
+        if solvetime is not None:
+            self.solvetime = solvetime
+        self.solve()
+        self.print_status_result_statistics()
+        self.show_gantt_chart(gantt_file)
+
+
+if __name__ == '__main__':
+    lots1 = cp.create_lots_from_tuplelist(cp.lot_data)
+    rhs = RollingHorizonScheduler(lots1, cp.type_transform_matrix, window=6, commit=3, solvetime=1)
+    rhs.main()
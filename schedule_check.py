@@ -0,0 +1,101 @@
+"""Check, evaluate and repair single-machine schedules given as start-time arrays in lot order.
+
+Setups follow the pairwise models: the lot at sequence position j starts no earlier than
+end_i + ttmatrix[type_i][type_j] for every lot i before it (adjacent=True: only the lot right before
+it, as in the circuit model). The sequence is the order of the start times, ties by lot position.
+"""
+from operator import add
+
+import numpy as np
+
+from Lot import lot_arrays
+
+TOL = 1e-6
+
+
+def sequence(startt):
+    """Lot positions in start order."""
+    return np.argsort(startt, kind='stable')
+
+
+def setup_ready(ltype, end, ttmatrix, adjacent=False):
+    """ready[j]: earliest start of position j allowed by the setups from the positions before it,
+    -inf for the first. ltype and end in sequence order. O(ntype * nlot) for all pairs: only the
+    latest end of every type before j can bind."""
+    tt = np.asarray(ttmatrix)
+    ready = np.full(len(end), -np.inf)
+    if len(end) < 2:
+        return ready
+    if adjacent:
+        ready[1:] = end[:-1] + tt[ltype[:-1], ltype[1:]]
+        return ready
+    types = np.unique(ltype)
+    last = np.maximum.accumulate(np.where(ltype[None, :] == types[:, None], end[None, :], -np.inf), axis=1)
+    ready[1:] = (last[:, :-1] + tt[types[:, None], ltype[None, 1:]]).max(axis=0)
+    return ready
+
+
+def check_schedule(arrivet, processt, ltype, startt, ttmatrix, adjacent=False, tol=TOL):
+    """Return {'release', 'overlap', 'setup': number of lots violating each, 'violation': the largest
+    violation in time units, 'feasible'}. Overlaps are also setup violations."""
+    order = sequence(startt)
+    st = np.asarray(startt, dtype=np.float64)[order]
+    end = st + processt[order]
+    lt = ltype[order]
+
+    release = arrivet[order] - st
+    overlap = np.full(len(st), -np.inf)
+    if len(st) > 1:
+        overlap[1:] = np.maximum.accumulate(end)[:-1] - st[1:]
+    setup = setup_ready(lt, end, ttmatrix, adjacent) - st
+
+    violation = max(float(release.max(initial=0)), float(overlap.max(initial=0)), float(setup.max(initial=0)))
+    return {'release': int((release > tol).sum()),
+            'overlap': int((overlap > tol).sum()),
+            'setup': int((setup > tol).sum()),
+            'violation': violation,
+            'feasible': violation <= tol}
+
+
+def evaluate_schedule(arrivet, processt, ltype, startt, ttmatrix):
+    """Return {'makespan', 'setup': setups between adjacent lots, 'idle': the rest of [0, makespan]
+    the machine neither processes nor sets up}."""
+    if len(startt) == 0:
+        return {'makespan': 0, 'setup': 0, 'idle': 0}
+    order = sequence(startt)
+    lt = ltype[order]
+    makespan = (np.asarray(startt)[order] + processt[order]).max()
+    setup = np.asarray(ttmatrix)[lt[:-1], lt[1:]].sum()
+    return {'makespan': makespan.item(), 'setup': setup.item(), 'idle': (makespan - processt.sum() - setup).item()}
+
+
+def repair_schedule(arrivet, processt, ltype, startt, ttmatrix, adjacent=False):
+    """Exact integer start times: the earliest schedule that keeps the sequence of startt, which may be
+    fractional or slightly infeasible. Never later than a feasible startt, lot by lot."""
+    tt = np.asarray(ttmatrix, dtype=np.int64)
+    al, pl, tl = arrivet.tolist(), processt.tolist(), ltype.tolist()
+    tt_rows, tt_cols = tt.tolist(), tt.T.tolist()
+    last_end = [-int(tt.max()) - 1] * len(tt)  # latest end of every type, never binding before the first lot
+    repaired = np.zeros(len(al), dtype=np.int64)
+
+    last = None
+    now = 0
+    for i in sequence(startt).tolist():
+        if adjacent:
+            st = max(al[i], now if last is None else now + tt_rows[last][tl[i]])
+        else:
+            st = max(al[i], now, max(map(add, last_end, tt_cols[tl[i]])))
+        now = st + pl[i]
+        last = tl[i]
+        last_end[last] = now
+        repaired[i] = st
+    return repaired
+
+
+def repair_lots(lots, startt, ttmatrix):
+    """Set the repaired start times of startt (in lot order) on lots, return the makespan."""
+    arrivet, processt, ltype = lot_arrays(lots)
+    repaired = repair_schedule(arrivet, processt, ltype, np.asarray(startt), ttmatrix)
+    for lot, st in zip(lots, repaired.tolist()):
+        lot.startt = st
+    return int((repaired + processt).max()) if len(lots) else 0
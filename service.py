@@ -0,0 +1,164 @@
+"""Long-running scheduling service: JSON lines in, JSON lines out, on stdin/stdout or a local socket.
+
+Every request is one JSON object on one line, lots are [arrive, processt, type] triples:
+
+    {"id": 1, "op": "solve", "engine": "cp", "lots": [[0, 3, 0], [2, 1, 1]], "ttmatrix": [[0, 1], [1, 0]],
+     "time_limit": 1.0}
+        solve the batch with engine (cp, lp, copt, heuristic), answer status, objv, bound, gap, time
+        and startt, the start time of every lot in request order; cached is true when the answer
+        came from the solution cache without solving
+    {"id": 2, "op": "arrive", "stream": "line1", "now": 10, "lots": [[10, 3, 0]], "ttmatrix": [[0, 1], [1, 0]],
+     "time_limit": 0.5}
+        lots of stream arrive at now: lots that started before now are frozen and the open ones are
+        re-optimized with the stream's IncrementalScheduler, ttmatrix is only read on the first event;
+        startt holds [lot number, start time] of every open lot, lots numbered in arrival order over
+        the stream. A frozen lot keeps the start time of the last answer that listed it
+    {"id": 3, "op": "close", "stream": "line1"}
+    {"op": "quit"}
+
+A request that fails is answered with {"id": ..., "error": message} and the service keeps running.
+Solver modules are imported once, the COPT Envr is created on the first COPT request and reused,
+and solver progress output goes to stderr so stdout only carries answers. With --cache-dir solve
+results survive restarts in a SolutionCache.
+"""
+import argparse
+import contextlib
+import json
+import os
+import socketserver
+import sys
+import time
+
+from Lot import Lot
+from rescheduler import IncrementalScheduler
+from solution_cache import SolutionCache, cached_solve
+
+
+def read_lots(rows, first=0):
+    """[arrive, processt, type] rows -> Lots numbered from first."""
+    return [Lot(idx=first + i, arrivet=r[0], processt=r[1], ltype=r[2]) for i, r in enumerate(rows)]
+
+
+class SchedulingService:
+
+    def __init__(self, time_limit=1.0, workers=1, cache_dir=None):
+        self.time_limit = time_limit
+        self.workers = workers
+        self.cache = None if cache_dir is None else SolutionCache(cache_dir)
+        self.envr = None
+        self.streams = {}
+
+    def get_envr(self):
+        if self.envr is None:
+            from coptpy import Envr
+            self.envr = Envr()
+        return self.envr
+
+    def solve(self, request):
+        engine = request.get('engine', 'cp')
+        extra = {'envr': self.get_envr()} if engine == 'copt' else None
+        result = cached_solve(read_lots(request['lots']), request['ttmatrix'], engine,
+                              request.get('time_limit', self.time_limit), self.cache, self.workers, extra=extra)
+        return {name: result[name] for name in ('status', 'objv', 'bound', 'gap', 'time', 'startt', 'cached')}
+
+    def arrive(self, request):
+        name = request['stream']
+        if name not in self.streams:
+            self.streams[name] = IncrementalScheduler(request['ttmatrix'])
+        scheduler = self.streams[name]
+
+        start = time.perf_counter()
+        now = request['now']
+        frozen = scheduler.freeze_before(now)
+        scheduler.add_lots(read_lots(request.get('lots', []), scheduler.nlot), now)
+        status = scheduler.reoptimize(request.get('time_limit', self.time_limit))
+
+        startt = None
+        if scheduler.has_solution():
+            startt = [[lot.idx, scheduler.solution[i]] for i, lot in scheduler.lots.items()]
+        return {'status': status,
+                'objv': scheduler.get_objective_value(),
+                'frozen': len(frozen),
+                'open': len(scheduler.lots),
+                'time': time.perf_counter() - start,
+                'startt': startt}
+
+    def close(self, request):
+        return {'closed': self.streams.pop(request['stream'], None) is not None}
+
+    def handle(self, request):
+        op = request.get('op', 'solve')
+        if op not in ('solve', 'arrive', 'close'):
+            raise ValueError('Unknown op: %s' % op)
+        with contextlib.redirect_stdout(sys.stderr):
+            return getattr(self, op)(request)
+
+    def handle_line(self, line):
+        """Answer one request line, None for quit."""
+        request = {}
+        try:
+            request = json.loads(line)
+            if request.get('op') == 'quit':
+                return None
+            answer = self.handle(request)
+        except Exception as e:
+            answer = {'error': '%s: %s' % (type(e).__name__, e)}
+        answer['id'] = request.get('id') if isinstance(request, dict) else None
+        return json.dumps(answer)
+
+    def serve(self, infile, outfile):
+        for line in infile:
+            if not line.strip():
+                continue
+            answer = self.handle_line(line)
+            if answer is None:
+                return False
+            outfile.write(answer + '\n')
+            outfile.flush()
+        return True
+
+    def serve_socket(self, path):
+        """Serve connections on a unix socket one after another, until a client sends quit."""
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                lines = (line.decode() for line in self.rfile)
+                out = self.wfile
+                if not service.serve(lines, _LineWriter(out)):
+                    self.server.quit = True
+
+        if os.path.exists(path):
+            os.remove(path)
+        with socketserver.UnixStreamServer(path, Handler) as server:
+            server.quit = False
+            while not server.quit:
+                server.handle_request()
+        os.remove(path)
+
+
+class _LineWriter:
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, s):
+        self.wfile.write(s.encode())
+
+    def flush(self):
+        self.wfile.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', help='serve on this unix socket path instead of stdin/stdout')
+    parser.add_argument('--time-limit', type=float, default=1.0, help='default time budget per request [s]')
+    parser.add_argument('--workers', type=int, default=1, help='search threads per solve')
+    parser.add_argument('--cache-dir', help='keep solve results in a solution cache in this directory')
+    args = parser.parse_args()
+
+    svc = SchedulingService(args.time_limit, args.workers, args.cache_dir)
+    if args.socket:
+        svc.serve_socket(args.socket)
+    else:
+        svc.serve(sys.stdin, sys.stdout)
@@ -0,0 +1,127 @@
+"""Minimize single lot-process machine's schedule with setup time constraint, deciding on type campaigns."""
+import time
+
+from Lot import lot_arrays
+from bounds import InstanceBounds, schedule_makespan
+from lower_bound import lower_bound
+from single_machine_setup_heuristic import dispatch
+import single_machine_setup_cp as cp
+
+
+def make_batches(lots, ttmatrix, max_batch, rule='batch'):
+    """Cut the dispatching sequence of rule into runs of one type with at most max_batch lots.
+    Return the runs as lists of lot positions and the dispatching schedule."""
+    arrivet, processt, ltype = lot_arrays(lots)
+    seq, startt = dispatch(arrivet, processt, ltype, ttmatrix, rule)
+
+    batches = []
+    for i in seq.tolist():
+        if batches and ltype[batches[-1][0]] == ltype[i] and len(batches[-1]) < max_batch:
+            batches[-1].append(i)
+        else:
+            batches.append([i])
+    return batches, {lot.idx: int(st) for lot, st in zip(lots, startt)}
+
+
+class SingleSetupBatchCP(cp.SingleSetupOrtoolsCP):
+    """Campaigns are the same-type runs of a dispatching sequence (rule), split after max_batch lots.
+    Lots of one campaign run in arrival order, waiting for releases if needed, and no other lot runs
+    inside the campaign. Setups are only decided between campaigns, so the model grows with the
+    number of campaigns. Campaigns of one type keep their arrival order. Restricting lots to
+    campaigns can exclude the optimal lot schedule. Even max_batch=1 keeps the arrival order within a
+    type, so it is not the pairwise model of SingleSetupOrtoolsCP."""
+
+    def __init__(self, lots, ttmatrix, max_batch=20, rule='batch'):
+        super().__init__(lots, ttmatrix)
+        self.max_batch = max_batch
+        self.rule = rule
+        self.batches = None
+        self.y = None
+
+    def add_batch_constraint(self, start, end):
+        model = self.model
+        ttmatrix = self.ttmatrix
+        btype = [self.lots[b[0]].ltype for b in self.batches]
+
+        nbatch = len(self.batches)
+        y = {}
+        for a in range(nbatch):
+            for b in range(a + 1, nbatch):
+                if btype[a] == btype[b]:
+                    # campaigns of one type come out of the dispatching sequence in arrival order
+                    model.Add(end[a] <= start[b])
+                    continue
+                y_ab = model.NewBoolVar('y_%i_%i' % (a, b))  # precedence: campaign a -> b
+                model.Add(end[a] + int(ttmatrix[btype[a]][btype[b]]) <= start[b]).OnlyEnforceIf(y_ab)
+                model.Add(end[b] + int(ttmatrix[btype[b]][btype[a]]) <= start[a]).OnlyEnforceIf(y_ab.Not())
+                y[a, b] = y_ab
+        self.y = y
+
+    def build_model(self, initial_schedule=None):
+        """initial_schedule: optional {lot idx: start time} hinted on the lot start times,
+        the dispatching schedule that defines the campaigns by default. The horizon comes from the
+        dispatching schedule, which is feasible for the campaigns; initial_schedule is only a hint."""
+        start_time = time.perf_counter()
+        lots = self.lots
+        model = self.model
+
+        self.batches, schedule = make_batches(lots, self.ttmatrix, self.max_batch, self.rule)
+        upper_bound = schedule_makespan(lots, schedule)
+        if initial_schedule is None:
+            initial_schedule = schedule
+        else:
+            # keep the hint inside the variable domains
+            upper_bound = max(upper_bound, schedule_makespan(lots, initial_schedule))
+        self.bounds = InstanceBounds(lots, self.ttmatrix, self.get_earliest_start(), upper_bound)
+        horizon = self.bounds.horizon
+        lb, ub = self.bounds.start_lb(), self.bounds.start_ub()
+        self.lower_bound = lower_bound(lots, self.ttmatrix, release=self.bounds.release)
+
+        # define variables
+        obj = model.NewIntVar(self.lower_bound, horizon, 'obj')
+        t = [model.NewIntVar(lb[i], ub[i], 't_%i' % lots[i].idx) for i in range(self.nlot)]
+        start, end, interval = [], [], []
+        for k, members in enumerate(self.batches):
+            first, last = members[0], members[-1]
+            for i, j in zip(members, members[1:]):
+                model.Add(t[i] + lots[i].processt <= t[j])
+            size = model.NewIntVar(sum(lots[i].processt for i in members), horizon, 'size_%i' % k)
+            start.append(t[first])
+            end.append(t[last] + lots[last].processt)
+            interval.append(model.NewIntervalVar(start[-1], size, end[-1], 'campaign_%i' % k))
+            model.Add(obj >= end[-1])
+        self.t = t
+        self.obj = obj
+        self.horizon = horizon
+
+        # add constraints
+        model.AddNoOverlap(interval)
+        self.add_batch_constraint(start, end)
+        for i, lot in enumerate(lots):
+            model.AddHint(t[i], int(round(initial_schedule[lot.idx])))
+
+        # set objective function
+        model.Minimize(obj)
+        self.build_time = time.perf_counter() - start_time
+
+    def get_solve_status(self):
+        """An optimal campaign schedule is only optimal for the restricted model: OPTIMAL is kept
+        when it reaches the instance lower bound, otherwise it is FEASIBLE."""
+        status = super().get_solve_status()
+        if status == 'OPTIMAL' and (self.objv is None or self.objv > self.lower_bound):
+            return 'FEASIBLE'
+        return status
+
+    def get_lower_bound(self):
+        """The instance lower bound; the solver bound only holds for the campaign orders."""
+        return self.lower_bound
+
+    def show_solve_statistics(self):
+        super().show_solve_statistics()
+        print('  - campaigns: %i' % len(self.batches))
+
+
+if __name__ == '__main__':
+    lots1 = cp.create_lots_from_tuplelist(cp.lot_data)
+    ssb = SingleSetupBatchCP(lots1, cp.type_transform_matrix, max_batch=3)
+    ssb.main()
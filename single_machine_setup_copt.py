@@ -1,6 +1,11 @@
 import collections
 
 from coptpy import *
+from bounds import InstanceBounds, feasible_makespan, pairwise_setup
+from build_profile import BuildProfile
+from lower_bound import get_gap, lower_bound
+from schedule_check import repair_lots
+from symmetry import precedence_fixings, print_report
 import single_machine_setup_cp as cp
 from graph import single_machine_setup_gantt
 
@@ -19,19 +24,27 @@ type_transform_matrix = [
 
 
 class SingleSetupCOPT:
+    """envr: an existing COPT Envr to create the model in, a new one by default.
+    Long-running callers pass one Envr to every model instead of starting a new one per instance."""
 
-    def __init__(self, lots, ttmatrix):
+    def __init__(self, lots, ttmatrix, preprocess=False, envr=None):
         self.lots = lots
         self.ttmatrix = ttmatrix
         self.nlot = len(lots)
+        self.preprocess = preprocess
 
-        self.envr = Envr()
+        self.envr = envr if envr is not None else Envr()
         self.model = self.envr.createModel()
         self.t = None
         self.x = None
         self.obj = None
         self.objv = None
         self.status = None
+        self.bounds = None
+        self.lower_bound = None
+        self.fixings = {}
+        self.preprocess_report = None
+        self.profile = BuildProfile()
 
     def add_obj_constraints(self):
         mdl = self.model
@@ -45,46 +58,98 @@ class SingleSetupCOPT:
     def add_precedence_constraint(self):
         lots = self.lots
         nlot = self.nlot
-        ttmatrix = self.ttmatrix
         mdl = self.model
         x = self.x
         t = self.t
 
         # 采用COPT.infinity会产生错误：生成的结果不符合要求
-        # M = 1e+6
-        M = 1e+5
+        # per-pair M from the instance bounds instead of a fixed 1e+5
+        M = self.bounds.bigm().tolist()
+        setup = pairwise_setup(self.bounds.ltype, self.ttmatrix).tolist()
         for i in range(nlot):
             for j in range(i + 1, nlot):
                 pi, pj = lots[i].processt, lots[j].processt
-                tt = cp.get_tt(lots, i, j, ttmatrix)
+                sij, sji = setup[i][j], setup[j][i]
+                fixed = self.fixings.get((i, j))
+                if fixed is not None:
+                    if fixed:
+                        mdl.addConstr(t[i] + pi + sij <= t[j])
+                    else:
+                        mdl.addConstr(t[j] + pj + sji <= t[i])
+                    continue
                 # Add Non-overlap constraint
-                mdl.addConstr(t[i] + pi + tt <= t[j] + M * (1 - x[i, j]))
-                mdl.addConstr(t[j] + pj + tt <= t[i] + M * x[i, j])
+                mdl.addConstr(t[i] + pi + sij <= t[j] + M[i][j] * (1 - x[i, j]))
+                mdl.addConstr(t[j] + pj + sji <= t[i] + M[j][i] * x[i, j])
 
-    def build_model(self):
+    def add_mip_start(self, initial_schedule):
+        lots = self.lots
+        nlot = self.nlot
+        mdl = self.model
+
+        st = [initial_schedule[lot.idx] for lot in lots]
+        variables = [self.t[i] for i in range(nlot)] + [self.obj]
+        values = st + [max(st[i] + lots[i].processt for i in range(nlot))]
+        for (i, j), x_ij in self.x.items():
+            variables.append(x_ij)
+            values.append(1 if st[i] < st[j] else 0)
+        mdl.setMipStart(variables, values)
+        mdl.loadMipStart()
+
+    def build_model(self, initial_schedule=None):
+        """initial_schedule: optional {lot idx: start time}, loaded as a MIP start.
+        Its makespan caps the horizon only when the schedule passes check_schedule."""
         # data
         lots = self.lots
         nlot = self.nlot
         mdl = self.model
+        profile = self.profile
+
+        with profile.phase('bounds'):
+            upper_bound = None if initial_schedule is None else feasible_makespan(lots, self.ttmatrix, initial_schedule)
+            self.bounds = InstanceBounds(lots, self.ttmatrix, upper_bound=upper_bound)
+            self.lower_bound = lower_bound(lots, self.ttmatrix)
+        if self.preprocess:
+            with profile.phase('preprocess'):
+                self.fixings, self.preprocess_report = precedence_fixings(self.bounds)
+            print_report(self.preprocess_report)
 
         # define variables
-        self.obj = mdl.addVar(vtype=COPT.CONTINUOUS)
-        self.t = mdl.addVars(nlot, lb=[lot.arrivet for lot in lots], vtype=COPT.CONTINUOUS, nameprefix='t')
-        self.x = mdl.addVars(nlot, nlot, vtype=COPT.BINARY, nameprefix='x')
+        with profile.phase('variables'):
+            self.obj = mdl.addVar(ub=self.bounds.horizon, vtype=COPT.CONTINUOUS)
+            self.t = mdl.addVars(nlot, lb=self.bounds.start_lb(), ub=self.bounds.start_ub(), vtype=COPT.CONTINUOUS,
+                                 nameprefix='t')
+            pairs = [(i, j) for i in range(nlot) for j in range(i + 1, nlot) if (i, j) not in self.fixings]
+            self.x = mdl.addVars(tuplelist(pairs), vtype=COPT.BINARY, nameprefix='x')
 
         # add constraints
-        self.add_obj_constraints()
-        self.add_precedence_constraint()
+        with profile.phase('objective'):
+            self.add_obj_constraints()
+        with profile.phase('setup'):
+            self.add_precedence_constraint()
+        if initial_schedule is not None:
+            with profile.phase('hint'):
+                self.add_mip_start(initial_schedule)
 
         # set objective function
         mdl.setObjective(self.obj, COPT.MINIMIZE)
+        profile.counts['nvariables'] = mdl.getAttr(COPT.Attr.Cols)
+        profile.counts['nconstraints'] = mdl.getAttr(COPT.Attr.Rows)
+
+    def show_build_profile(self):
+        self.profile.print_profile()
 
     def set_solve_time(self, t):
         self.model.setParam(COPT.Param.TimeLimit, t)
 
-    def solve(self):
+    def set_num_workers(self, n):
+        self.model.setParam(COPT.Param.Threads, n)
+
+    def solve(self, callback=None):
+        """callback: optional CallbackBase, called on every new MIP solution."""
         print('Start Solving...\n...')
         model = self.model
+        if callback is not None:
+            model.setCallback(callback, COPT.CBCONTEXT_MIPSOL)
         # solve the problem
         model.solve()
         self.status = model.status
@@ -122,12 +187,11 @@ class SingleSetupCOPT:
         model = self.model
         t = self.t
 
-        # save the result
+        # save the result, as exact integers in the solver's sequence: with a large M the
+        # MIP start times can be fractional or slightly infeasible
         for i in range(nlot):
-            lots[i].startt = t[i].x
             print('%i: ' % i + str(t[i].x))
-
-        self.objv = model.objval
+        self.objv = repair_lots(lots, [t[i].x for i in range(nlot)], self.ttmatrix)
         # sort lots by sequence
         lots.sort(key=lambda lot: lot.startt)
 
@@ -139,6 +203,7 @@ class SingleSetupCOPT:
         print('Solution Status: ' + self.get_solve_status())
         if self.has_solution():
             cp.print_lot_schedule(self.lots, self.objv)
+            print('Lower bound: %f, gap: %.2f%%' % (self.get_lower_bound(), 100 * self.get_gap()))
 
     # def show_solve_statistics(self):
     #     # Statistics.
@@ -146,9 +211,9 @@ class SingleSetupCOPT:
     #     print(self.get_solve_status())
     #     print(self.get_solve_time())
 
-    def show_gantt_chart(self):
+    def show_gantt_chart(self, path=None):
         if self.has_solution():
-            single_machine_setup_gantt(self.lots, self.ttmatrix)
+            single_machine_setup_gantt(self.lots, self.ttmatrix, path)
         else:
             print('No gantt chart to show!')
 
@@ -158,12 +223,20 @@ class SingleSetupCOPT:
     def get_objective_value(self):
         return self.objv
 
-    def main(self, solvetime=10):
+    def get_lower_bound(self):
+        if not self.has_solution():
+            return self.lower_bound
+        return max(self.lower_bound, self.model.getAttr(COPT.Attr.BestBnd))
+
+    def get_gap(self):
+        return get_gap(self.objv, self.get_lower_bound())
+
+    def main(self, solvetime=10, gantt_file=None):
         self.build_model()
         self.set_solve_time(solvetime)
         self.solve()
         self.print_status_result_statistics()
-        self.show_gantt_chart()
+        self.show_gantt_chart(gantt_file)
 
 
 if __name__ == '__main__':
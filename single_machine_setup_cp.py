@@ -1,6 +1,16 @@
 """Minimize single lot-process machine's schedule with setup time constraint."""
 import collections
-from Lot import Lot
+import math
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from Lot import Lot, lot_arrays, lot_column
+from bounds import InstanceBounds, feasible_makespan, pairwise_setup
+from build_profile import BuildProfile
+from lower_bound import get_gap, lower_bound
+from symmetry import precedence_fixings, print_report
 from graph import single_machine_setup_gantt
 
 from ortools.sat.python import cp_model
@@ -33,8 +43,8 @@ def create_lots(ats, pts, tps):
     return lots
 
 
-def calculate_horizon(lots):
-    return sum(lot.processt for lot in lots) * 3
+def calculate_horizon(lots, ttmatrix):
+    return InstanceBounds(lots, ttmatrix).horizon
 
 
 def get_tt(lots, i, j, tt_matrix):
@@ -43,10 +53,21 @@ def get_tt(lots, i, j, tt_matrix):
     return int(tt_matrix[ti][tj])
 
 
+def set_domain(model, var, lb, ub):
+    """Change the domain of a variable of a built model in place."""
+    domain = model.Proto().variables[var.Index()].domain
+    domain.clear()
+    domain.extend([lb, ub])
+
+
 def add_obj_constraints(model, obj, t, lots):
-    nlot = len(lots)
-    for i in range(nlot):
-        model.Add(obj >= t[i] + lots[i].processt)
+    for ti, pt in zip(t, lot_arrays(lots)[1].tolist()):
+        model.Add(obj >= ti + pt)
+
+
+def get_schedule(lots):
+    """Return the schedule of lots as {lot idx: start time}, the format of initial_schedule."""
+    return {lot.idx: lot.startt for lot in lots}
 
 
 def print_lot_schedule(lots, objv):
@@ -54,13 +75,10 @@ def print_lot_schedule(lots, objv):
     sol_line_tasks = 'Machine ' + ': '
     sol_line = '         '
 
-    for lot in lots:
-        i = lot.idx
-        tp = lot.ltype
-        at = lot.arrivet
-        st = lot.startt
-        pt = lot.processt
-
+    arrivet, processt, ltype = lot_arrays(lots)
+    columns = (lot_column(lots, 'idx').tolist(), ltype.tolist(), arrivet.tolist(),
+               lot_column(lots, 'startt', np.float64).tolist(), processt.tolist())
+    for i, tp, at, st, pt in zip(*columns):
         name = 'lot_%i:t%i' % (i, tp)
         # Add spaces to output to align columns.
         sol_line_tasks += '%-15s' % name
@@ -79,69 +97,254 @@ def print_lot_schedule(lots, objv):
 
 
 class SingleSetupOrtoolsCP:
+    """formulation: 'pairwise' adds one precedence bool per lot pair,
+    'circuit' adds one successor arc per ordered lot pair and links them with AddCircuit.
+    preprocess: fix the lot pairs whose order symmetry.precedence_fixings already decides.
+    fast: build the pairwise setup constraints without names, computed with numpy and written
+    into the model proto directly instead of through model.Add. About 2x faster to build at
+    500 lots."""
+
+    formulations = ('pairwise', 'circuit')
+
+    def __init__(self, lots, ttmatrix, formulation='pairwise', preprocess=False, fast=False):
+        if formulation not in self.formulations:
+            raise ValueError('Unknown formulation: %s' % formulation)
 
-    def __init__(self, lots, ttmatrix):
         self.lots = lots
         self.ttmatrix = ttmatrix
         self.nlot = len(lots)
+        self.formulation = formulation
+        self.preprocess = preprocess
+        self.fast = fast
 
         self.model = cp_model.CpModel()
         self.solver = cp_model.CpSolver()
         self.t = None
+        self.x = None
+        self.arcs = None
         self.obj = None
         self.status = None
         self.objv = None
+        self.build_time = None
+        self.type_ready = None
+        self.horizon = None
+        self.bounds = None
+        self.lower_bound = None
+        self.fixings = {}
+        self.preprocess_report = None
+        self.profile = BuildProfile()
 
     def add_setup_constraint(self):
         model = self.model
         t = self.t
         lots = self.lots
-        ttmatrix = self.ttmatrix
+        setup = pairwise_setup(self.bounds.ltype, self.ttmatrix).tolist()
 
         nlot = len(lots)
+        x = {}
         for i in range(nlot):
             for j in range(i + 1, nlot):
-                x_ij = model.NewBoolVar('x_%i%i' % (i, j))  # precedence: i -> j
                 ti, tj = t[i], t[j]
                 di, dj = lots[i].processt, lots[j].processt
-                tt = get_tt(lots, i, j, ttmatrix)
-                model.Add(tj + dj + tt <= ti).OnlyEnforceIf(x_ij.Not())
-                model.Add(ti + di + tt <= tj).OnlyEnforceIf(x_ij)
+                sij, sji = setup[i][j], setup[j][i]
+                fixed = self.fixings.get((i, j))
+                if fixed is not None:
+                    if fixed:
+                        model.Add(ti + di + sij <= tj)
+                    else:
+                        model.Add(tj + dj + sji <= ti)
+                    continue
+                x_ij = model.NewBoolVar('x_%i%i' % (i, j))  # precedence: i -> j
+                model.Add(tj + dj + sji <= ti).OnlyEnforceIf(x_ij.Not())
+                model.Add(ti + di + sij <= tj).OnlyEnforceIf(x_ij)
+                x[i, j] = x_ij
+        self.x = x
+
+    def add_setup_constraint_fast(self):
+        """The constraints of add_setup_constraint, each written as -horizon <= t_a - t_b <= rhs,
+        optionally enforced by x_ij (literal index) or its negation (-index - 1). The arguments are
+        computed as numpy arrays and written into the model proto directly."""
+        model = self.model
+        proto = model.Proto()
+        nlot = self.nlot
+        processt = self.bounds.processt
+        setup = pairwise_setup(self.bounds.ltype, self.ttmatrix)
+        tindex = np.array([v.Index() for v in self.t], dtype=np.int64)
+
+        i, j = np.triu_indices(nlot, k=1)
+        fixed = np.full((nlot, nlot), -1, dtype=np.int64)
+        for (a, b), value in self.fixings.items():
+            fixed[a, b] = value
+        fixed = fixed[i, j]
+        free = fixed < 0
+        rhs_ij = -(processt[i] + setup[i, j])  # i -> j: t_i - t_j <= -(p_i + s_ij)
+        rhs_ji = -(processt[j] + setup[j, i])  # j -> i: t_j - t_i <= -(p_j + s_ji)
+
+        # fixed pairs get one unconditional constraint in their fixed direction
+        first = fixed == 1
+        second = fixed == 0
+        plain = np.concatenate((np.stack((tindex[i[first]], tindex[j[first]], rhs_ij[first]), axis=1),
+                                np.stack((tindex[j[second]], tindex[i[second]], rhs_ji[second]), axis=1)))
+
+        fi, fj = i[free], j[free]
+        literal = len(proto.variables) + np.arange(len(fi), dtype=np.int64)
+        enforced = np.stack((literal, tindex[fi], tindex[fj], rhs_ij[free],
+                             -literal - 1, tindex[fj], tindex[fi], rhs_ji[free]), axis=1)
+
+        # the bool variables share one domain, extend copies it in bulk
+        if len(fi):
+            var = proto.variables.add()
+            var.domain.extend((0, 1))
+            proto.variables.extend([var] * (len(fi) - 1))
+
+        # t_a - t_b >= -horizon always holds
+        lb = -self.horizon
+        constraints = proto.constraints
+        for a, b, rhs in plain.tolist():
+            linear = constraints.add().linear
+            linear.vars.extend((a, b))
+            linear.coeffs.extend((1, -1))
+            linear.domain.extend((lb, rhs))
+        for row in enforced.tolist():
+            for k in (0, 4):
+                constraint = constraints.add()
+                constraint.enforcement_literal.append(row[k])
+                linear = constraint.linear
+                linear.vars.extend(row[k + 1:k + 3])
+                linear.coeffs.extend((1, -1))
+                linear.domain.extend((lb, row[k + 3]))
+
+        variables = [cp_model.IntVar(proto, k) for k in literal.tolist()]
+        self.x = dict(zip(zip(fi.tolist(), fj.tolist()), variables))
+
+    def add_circuit_constraint(self):
+        model = self.model
+        t = self.t
+        lots = self.lots
+        setup = pairwise_setup(self.bounds.ltype, self.ttmatrix).tolist()
 
-    def build_model(self):
+        # node nlot is a dummy depot: depot -> i starts the sequence, i -> depot ends it
+        nlot = len(lots)
+        depot = nlot
+        arcs = {}
+        for i in range(nlot):
+            arcs[depot, i] = model.NewBoolVar('start_%i' % i)
+            arcs[i, depot] = model.NewBoolVar('end_%i' % i)
+            for j in range(nlot):
+                if i == j:
+                    continue
+                # a fixed order j -> i rules out the arc i -> j
+                fixed = self.fixings.get((min(i, j), max(i, j)))
+                if fixed is not None and (fixed == 1) != (i < j):
+                    model.Add(t[j] + lots[j].processt <= t[i])
+                    continue
+                l_ij = model.NewBoolVar('l_%i_%i' % (i, j))  # successor: i -> j
+                model.Add(t[i] + lots[i].processt + setup[i][j] <= t[j]).OnlyEnforceIf(l_ij)
+                arcs[i, j] = l_ij
+
+        model.AddCircuit([(i, j, l) for (i, j), l in arcs.items()])
+        self.arcs = arcs
+
+    def add_hint(self, initial_schedule):
+        model = self.model
+        lots = self.lots
+        nlot = self.nlot
+
+        st = [int(round(initial_schedule[lot.idx])) for lot in lots]
+        for i in range(nlot):
+            model.AddHint(self.t[i], st[i])
+        model.AddHint(self.obj, max(st[i] + lots[i].processt for i in range(nlot)))
+
+        if self.x is not None:
+            for (i, j), x_ij in self.x.items():
+                model.AddHint(x_ij, st[i] < st[j])
+        if self.arcs is not None:
+            seq = sorted(range(nlot), key=lambda i: st[i])
+            succ = dict(zip([nlot] + seq, seq + [nlot]))
+            for (i, j), l_ij in self.arcs.items():
+                model.AddHint(l_ij, succ[i] == j)
+
+    def set_machine_state(self, type_ready):
+        """type_ready[k]: earliest start of a type k lot after the lots already fixed on the machine."""
+        self.type_ready = type_ready
+
+    def get_earliest_start(self):
+        if self.type_ready is None:
+            return [lot.arrivet for lot in self.lots]
+        return [max(lot.arrivet, int(self.type_ready[lot.ltype])) for lot in self.lots]
+
+    def build_model(self, initial_schedule=None):
+        """initial_schedule: optional {lot idx: start time}, e.g. from get_schedule, added as solver hints.
+        Its makespan caps the horizon only when the schedule passes check_schedule."""
+        start = time.perf_counter()
         # data
         lots = self.lots
         model = self.model
         nlot = self.nlot
-        horizon = calculate_horizon(lots)  # upper bound of time variables
+        profile = self.profile
+        with profile.phase('bounds'):
+            upper_bound = None if initial_schedule is None else \
+                feasible_makespan(lots, self.ttmatrix, initial_schedule, self.get_earliest_start())
+            self.bounds = InstanceBounds(lots, self.ttmatrix, self.get_earliest_start(), upper_bound)
+            horizon = self.bounds.horizon  # upper bound of time variables
+            lb, ub = self.bounds.start_lb(), self.bounds.start_ub()
+            # the objective starts at the instance lower bound, so reaching it proves optimality at once
+            self.lower_bound = lower_bound(lots, self.ttmatrix, release=self.bounds.release)
+        if self.preprocess:
+            with profile.phase('preprocess'):
+                # setups only bind adjacent lots in the circuit model, so time windows are checked without them
+                self.fixings, self.preprocess_report = precedence_fixings(self.bounds,
+                                                                          setups=self.formulation == 'pairwise')
+            print_report(self.preprocess_report)
 
         # define variables
-        obj = model.NewIntVar(0, horizon, 'obj')
-        t = [model.NewIntVar(lot.arrivet, horizon, 't_%i' % lot.idx) for lot in lots]
-        interval = [model.NewIntervalVar(t[i], lots[i].processt, t[i] + lots[i].processt, 'interval_%i' % i) for i in
-                    range(nlot)]
+        with profile.phase('variables'):
+            obj = model.NewIntVar(self.lower_bound, horizon, 'obj')
+            t = [model.NewIntVar(lb[i], ub[i], 't_%i' % lots[i].idx) for i in range(nlot)]
+            interval = [model.NewIntervalVar(t[i], lots[i].processt, t[i] + lots[i].processt, 'interval_%i' % i)
+                        for i in range(nlot)]
         # save variables to object
         self.t = t
         self.obj = obj
+        self.horizon = horizon
 
         # add constraints
-        add_obj_constraints(model, obj, t, lots)
-        model.AddNoOverlap(interval)
-        self.add_setup_constraint()
+        with profile.phase('objective'):
+            add_obj_constraints(model, obj, t, lots)
+            model.AddNoOverlap(interval)
+        with profile.phase('setup'):
+            if self.formulation == 'circuit':
+                self.add_circuit_constraint()
+            elif self.fast:
+                self.add_setup_constraint_fast()
+            else:
+                self.add_setup_constraint()
+        if initial_schedule is not None:
+            with profile.phase('hint'):
+                self.add_hint(initial_schedule)
 
         # set objective function
         model.Minimize(obj)
+        self.build_time = time.perf_counter() - start
+        profile.counts['nvariables'], profile.counts['nconstraints'] = self.get_model_size()
 
     def set_solve_time(self, t):
         self.solver.parameters.max_time_in_seconds = t
 
-    def solve(self):
+    def set_num_workers(self, n):
+        self.solver.parameters.num_search_workers = n
+
+    def set_random_seed(self, seed):
+        self.solver.parameters.random_seed = seed
+
+    def solve(self, callback=None):
+        """callback: optional CpSolverSolutionCallback, called on every improving solution."""
         print('Start Solving...\n...')
         model = self.model
         solver = self.solver
 
         # solve and save the result
-        self.status = solver.Solve(model)
+        self.status = solver.Solve(model, callback)
 
         print('Solve Complete.')
         # save the result
@@ -182,10 +385,13 @@ class SingleSetupOrtoolsCP:
         print('  - conflicts: %i' % solver.NumConflicts())
         print('  - branches : %i' % solver.NumBranches())
         print('  - wall time: %f s' % solver.WallTime())
+        print('  - bound    : %i' % self.get_lower_bound())
+        if self.has_solution():
+            print('  - gap      : %.2f%%' % (100 * self.get_gap()))
 
-    def show_gantt_chart(self):
+    def show_gantt_chart(self, path=None):
         if self.has_solution():
-            single_machine_setup_gantt(self.lots, self.ttmatrix)
+            single_machine_setup_gantt(self.lots, self.ttmatrix, path)
         else:
             print('No gantt chart to show!')
 
@@ -206,15 +412,58 @@ class SingleSetupOrtoolsCP:
     def get_solve_time(self):
         return self.solver.WallTime()
 
+    def get_build_time(self):
+        return self.build_time
+
+    def show_build_profile(self):
+        self.profile.print_profile()
+
+    def get_model_size(self):
+        proto = self.model.Proto()
+        return len(proto.variables), len(proto.constraints)
+
     def get_objective_value(self):
         return self.objv
 
-    def main(self, solvetime=10):
+    def get_lower_bound(self):
+        if self.status is None:
+            return self.lower_bound
+        return max(self.lower_bound, int(math.ceil(self.solver.BestObjectiveBound())))
+
+    def get_gap(self):
+        return get_gap(self.objv, self.get_lower_bound())
+
+    def main(self, solvetime=10, gantt_file=None):
         self.build_model()
         self.set_solve_time(solvetime)
         self.solve()
         self.print_status_result_statistics()
-        self.show_gantt_chart()
+        self.show_gantt_chart(gantt_file)
+
+
+def compare_formulations(lots, ttmatrix, solvetime=10):
+    """Build and solve every formulation on a copy of lots, print and return the statistics."""
+    rows = []
+    for formulation in SingleSetupOrtoolsCP.formulations:
+        mdl = SingleSetupOrtoolsCP(deepcopy(lots), ttmatrix, formulation=formulation)
+        mdl.build_model()
+        mdl.set_solve_time(solvetime)
+        mdl.solve()
+        nvar, ncons = mdl.get_model_size()
+        rows.append({'formulation': formulation,
+                     'build_time': mdl.get_build_time(),
+                     'variables': nvar,
+                     'constraints': ncons,
+                     'solve_time': mdl.get_solve_time(),
+                     'objv': mdl.get_objective_value(),
+                     'status': mdl.get_solve_status()})
+
+    print('%-12s%-12s%-12s%-12s%-12s%-10s%s' % ('model', 'build(s)', 'variables', 'constraints', 'solve(s)',
+                                                'objv', 'status'))
+    for r in rows:
+        print('%-12s%-12.3f%-12i%-12i%-12.3f%-10s%s' % (r['formulation'], r['build_time'], r['variables'],
+                                                       r['constraints'], r['solve_time'], r['objv'], r['status']))
+    return rows
 
 
 if __name__ == '__main__':
@@ -0,0 +1,232 @@
+"""Schedule a single lot-process machine with setup times by dispatching rules, without a solver."""
+import math
+import time
+
+import numpy as np
+
+from Lot import lot_arrays
+from lower_bound import get_gap, lower_bound
+from graph import single_machine_setup_gantt
+import single_machine_setup_cp as cp
+
+"""Test Date"""
+# (arrive, duration, type)
+lot_data = [(0, 3, 0), (11, 2, 1), (28, 2, 2), (0, 2, 2), (2, 1, 1), (19, 4, 0), (1, 4, 0), (2, 3, 1),
+            (10, 3, 0), (20, 2, 1), (21, 2, 1)]
+type_transform_matrix = [
+    [0, 1, 2],
+    [1, 0, 3],
+    [2, 3, 0]
+]
+
+INF = np.iinfo(np.int64).max // 2
+RULES = ('erd', 'setup', 'atcs', 'batch')
+
+
+def select_type(rule, ready, head_r, head_p, type_ready, now, last, released, scale):
+    """Pick the type whose earliest unscheduled lot goes next among the ready types (those with a
+    released lot). Per-type state comes in lists: with a handful of types a Python pass is cheaper
+    than a NumPy call per step."""
+    if rule == 'setup':
+        return min(ready, key=type_ready.__getitem__)
+
+    if rule == 'atcs':
+        pscale, sscale = scale
+        return max(ready, key=lambda m: math.exp(-max(head_r[m] - now, 0) / pscale -
+                                                 (type_ready[m] - now) / sscale) / max(head_p[m], 1))
+
+    # batch: stay on the current type while it has a released lot, else switch to the type with most work
+    if last >= 0 and last in ready:
+        return last
+    count = released()
+    return max(ready, key=count.__getitem__)
+
+
+def dispatch(arrivet, processt, ltype, ttmatrix, rule='setup', k1=2.0, k2=1.0, type_ready=None):
+    """Build a schedule lot by lot with one dispatching rule.
+
+    A lot of type k may start once every scheduled lot of type m has finished plus ttmatrix[m][k],
+    so the schedule satisfies the pairwise setup constraints of the solver models.
+    Lots of one type are taken in arrival order, so each step compares one head lot per type.
+    type_ready optionally gives the per-type earliest start left by lots already on the machine.
+    Return the lot positions in processing order and the start time of every lot.
+    """
+    if rule not in RULES:
+        raise ValueError('Unknown rule: %s' % rule)
+
+    arrivet = np.asarray(arrivet, dtype=np.int64)
+    processt = np.asarray(processt, dtype=np.int64)
+    ltype = np.asarray(ltype, dtype=np.int64)
+    tt = np.asarray(ttmatrix, dtype=np.int64)
+    nlot, ntype = len(arrivet), len(tt)
+
+    order = np.argsort(arrivet, kind='stable')
+    seq = np.empty(nlot, dtype=np.int64)
+    startt = np.empty(nlot, dtype=np.int64)
+    if rule == 'erd':
+        seq[:] = order
+    else:
+        # one arrival-ordered queue per type, padded so the head of an empty queue arrives at INF
+        order = order[np.argsort(ltype[order], kind='stable')]
+        first = np.searchsorted(ltype[order], np.arange(ntype + 1))
+        queues = [order[first[k]:first[k + 1]].tolist() for k in range(ntype)]
+        qr = [arrivet[q].tolist() + [INF] for q in queues]
+        qp = [processt[q].tolist() + [0] for q in queues]
+        head = [0] * ntype
+        head_r = [q[0] for q in qr]
+        head_p = [q[0] for q in qp]
+
+        # every queue sorted by (type, arrival), so one searchsorted counts the released lots of all types
+        key_scale = int(arrivet.max()) + 2 if nlot else 1
+        keys = ltype[order] * key_scale + arrivet[order]
+        offsets = np.arange(ntype) * key_scale
+
+        offdiag = tt[~np.eye(ntype, dtype=bool)]
+        scale = (k1 * max(processt.mean(), 1) if nlot else 1.0, k2 * max(offdiag.mean(), 1) if offdiag.size else 1.0)
+        lookahead = scale[0] if rule == 'atcs' else 0
+        types = range(ntype)
+
+        def released():
+            """Released lots per type at horizon that are still unscheduled."""
+            at = offsets + min(horizon, key_scale - 1)
+            return (np.searchsorted(keys, at, side='right') - first[:-1] - head).tolist()
+
+    # per-lot scalars are read from lists, the setup update of all types is one NumPy call
+    al, pl, tl = arrivet.tolist(), processt.tolist(), ltype.tolist()
+    # earliest start of each type, the machine is free at the earliest of them
+    if type_ready is None:
+        type_ready = np.zeros(ntype, dtype=np.int64)
+        now, last = 0, -1
+    else:
+        type_ready = np.array(type_ready, dtype=np.int64)
+        now, last = int(type_ready.min()), int(type_ready.argmin())
+    for k in range(nlot):
+        if rule == 'erd':
+            j = int(seq[k])
+        else:
+            horizon = max(now, min(head_r)) + lookahead
+            ready = [m for m in types if head_r[m] <= horizon]
+            m = select_type(rule, ready, head_r, head_p, type_ready.tolist(), now, last, released, scale)
+            j = queues[m][head[m]]
+            head[m] += 1
+            head_r[m], head_p[m] = qr[m][head[m]], qp[m][head[m]]
+            seq[k] = j
+
+        last = tl[j]
+        st = max(al[j], int(type_ready[last]))
+        now = st + pl[j]
+        np.maximum(type_ready, now + tt[last], out=type_ready)
+        startt[j] = st
+
+    return seq, startt
+
+
+def heuristic_schedule(lots, ttmatrix, rule='setup', type_ready=None):
+    """Return a dispatching-rule schedule as {lot idx: start time} without touching lots."""
+    arrivet, processt, ltype = lot_arrays(lots)
+    _, startt = dispatch(arrivet, processt, ltype, ttmatrix, rule, type_ready=type_ready)
+    return {lot.idx: int(st) for lot, st in zip(lots, startt)}
+
+
+class SingleSetupHeuristic:
+    """Same interface as the solver classes; solve() runs a dispatching rule instead of a search."""
+
+    def __init__(self, lots, ttmatrix, rule='setup'):
+        if rule not in RULES:
+            raise ValueError('Unknown rule: %s' % rule)
+
+        self.lots = lots
+        self.ttmatrix = ttmatrix
+        self.nlot = len(lots)
+        self.rule = rule
+
+        self.arrivet = None
+        self.processt = None
+        self.ltype = None
+        self.startt = None
+        self.status = None
+        self.objv = None
+        self.solve_time = None
+        self.lower_bound = None
+
+    def build_model(self):
+        self.arrivet, self.processt, self.ltype = lot_arrays(self.lots)
+        self.lower_bound = lower_bound(self.lots, self.ttmatrix)
+
+    def set_solve_time(self, t):
+        # dispatching finishes in one pass, there is no time limit to set
+        pass
+
+    def solve(self):
+        start = time.perf_counter()
+        _, self.startt = dispatch(self.arrivet, self.processt, self.ltype, self.ttmatrix, self.rule)
+        self.solve_time = time.perf_counter() - start
+        self.status = 'FEASIBLE' if self.nlot else 'NOT_SOLVED'
+        if self.has_solution():
+            self.save_result()
+
+    def save_result(self):
+        for i in range(self.nlot):
+            self.lots[i].startt = int(self.startt[i])
+
+        self.objv = int((self.startt + self.processt).max())
+        # sort lots by sequence
+        self.lots.sort(key=lambda lot: lot.startt)
+
+    def print_status_result_statistics(self):
+        self.show_solve_status_and_result()
+        self.show_solve_statistics()
+
+    def has_solution(self):
+        return self.get_solve_status() == 'FEASIBLE'
+
+    def show_solve_status_and_result(self):
+        print('Solution Status: ' + self.get_solve_status())
+        if self.has_solution():
+            cp.print_lot_schedule(self.lots, self.objv)
+
+    def show_solve_statistics(self):
+        print('Statistics')
+        print('  - rule     : %s' % self.rule)
+        print('  - wall time: %f s' % self.solve_time)
+        print('  - bound    : %i' % self.lower_bound)
+        if self.has_solution():
+            print('  - gap      : %.2f%%' % (100 * self.get_gap()))
+
+    def show_gantt_chart(self, path=None):
+        if self.has_solution():
+            single_machine_setup_gantt(self.lots, self.ttmatrix, path)
+        else:
+            print('No gantt chart to show!')
+
+    def get_solve_status(self):
+        return self.status or 'NOT_SOLVED'
+
+    def get_solve_time(self):
+        return self.solve_time
+
+    def get_objective_value(self):
+        return self.objv
+
+    def get_lower_bound(self):
+        return self.lower_bound
+
+    def get_gap(self):
+        return get_gap(self.objv, self.lower_bound)
+
+    def main(self, solvetime=10, gantt_file=None):
+        self.build_model()
+        self.set_solve_time(solvetime)
+        self.solve()
+        self.print_status_result_statistics()
+        self.show_gantt_chart(gantt_file)
+
+
+if __name__ == '__main__':
+    ttmatrix = type_transform_matrix
+    for rule in RULES:
+        lots1 = cp.create_lots_from_tuplelist(lot_data)
+        ssh = SingleSetupHeuristic(lots1, ttmatrix, rule)
+        ssh.build_model()
+        ssh.solve()
+        ssh.print_status_result_statistics()
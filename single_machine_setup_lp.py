@@ -1,7 +1,14 @@
 """Minimize single lot-process machine's schedule with setup time constraint."""
+import math
 
-from ortools.linear_solver import pywraplp
+import numpy as np
+from ortools.linear_solver import linear_solver_pb2, pywraplp
 from Lot import Lot
+from bounds import InstanceBounds, feasible_makespan, pairwise_setup
+from build_profile import BuildProfile
+from lower_bound import get_gap, lower_bound
+from schedule_check import repair_lots
+from symmetry import precedence_fixings, print_report
 from graph import single_machine_setup_gantt
 import single_machine_setup_cp as cp
 
@@ -17,11 +24,15 @@ type_transform_matrix = [
 
 
 class SingleSetupOrtoolsLP:
+    """fast: fill an MPModelProto without names and load it with one LoadModelFromProto call,
+    instead of building every constraint through the natural linear expression API."""
 
-    def __init__(self, lots, ttmatrix, solvername='SCIP'):
+    def __init__(self, lots, ttmatrix, solvername='SCIP', preprocess=False, fast=False):
         self.lots = lots
         self.ttmatrix = ttmatrix
         self.nlot = len(lots)
+        self.preprocess = preprocess
+        self.fast = fast
 
         self.solver = pywraplp.Solver.CreateSolver(solvername)
         self.t = None
@@ -29,45 +40,157 @@ class SingleSetupOrtoolsLP:
         self.obj = None
         self.status = None
         self.objv = None
+        self.bounds = None
+        self.lower_bound = None
+        self.fixings = {}
+        self.preprocess_report = None
+        self.profile = BuildProfile()
 
     def add_precedence_constraint(self):
         lots = self.lots
         nlot = self.nlot
-        ttmatrix = self.ttmatrix
         solver = self.solver
         x = self.x
         t = self.t
 
-        M = 1e5
+        M = self.bounds.bigm().tolist()
+        setup = pairwise_setup(self.bounds.ltype, self.ttmatrix).tolist()
         for i in range(nlot):
             for j in range(i + 1, nlot):
                 pi, pj = lots[i].processt, lots[j].processt
-                tt = cp.get_tt(lots, i, j, ttmatrix)
+                sij, sji = setup[i][j], setup[j][i]
+                fixed = self.fixings.get((i, j))
+                if fixed is not None:
+                    if fixed:
+                        solver.Add(t[i] + pi + sij <= t[j])
+                    else:
+                        solver.Add(t[j] + pj + sji <= t[i])
+                    continue
                 # Add Non-overlap constraint
-                solver.Add(t[i] + pi + tt <= t[j] + M * (1 - x[i][j]))
-                solver.Add(t[j] + pj + tt <= t[i] + M * x[i][j])
+                solver.Add(t[i] + pi + sij <= t[j] + M[i][j] * (1 - x[i, j]))
+                solver.Add(t[j] + pj + sji <= t[i] + M[j][i] * x[i, j])
 
-    def build_model(self):
+    def load_model_proto(self):
+        """The variables and constraints of build_model as one MPModelProto. Variable order is
+        obj, t_0 .. t_n-1, then x_ij of the free pairs; every constraint is a row of ±1 t coefficients
+        and an optional big-M x coefficient."""
+        nlot = self.nlot
+        bounds = self.bounds
+        processt = bounds.processt
+        setup = pairwise_setup(bounds.ltype, self.ttmatrix)
+        M = bounds.bigm()
+
+        i, j = np.triu_indices(nlot, k=1)
+        fixed = np.full((nlot, nlot), -1, dtype=np.int64)
+        for (a, b), value in self.fixings.items():
+            fixed[a, b] = value
+        fixed = fixed[i, j]
+        free = fixed < 0
+        fi, fj = i[free], j[free]
+        xindex = 1 + nlot + np.arange(len(fi))
+        rhs_ij = -(processt[i] + setup[i, j])  # i -> j: t_i - t_j <= -(p_i + s_ij)
+        rhs_ji = -(processt[j] + setup[j, i])  # j -> i: t_j - t_i <= -(p_j + s_ji)
+
+        proto = linear_solver_pb2.MPModelProto()
+        add_var = proto.variable.add
+        add_var(lower_bound=0, upper_bound=bounds.horizon, objective_coefficient=1)
+        for lb, ub in zip(bounds.start_lb(), bounds.start_ub()):
+            add_var(lower_bound=lb, upper_bound=ub)
+        for _ in range(len(fi)):
+            add_var(lower_bound=0, upper_bound=1, is_integer=True)
+
+        add_row = proto.constraint.add
+        # obj >= t_i + p_i
+        for k, p in enumerate(processt.tolist()):
+            add_row(var_index=[0, 1 + k], coefficient=[1, -1], lower_bound=p, upper_bound=math.inf)
+        # fixed pairs only in their fixed direction
+        first, second = fixed == 1, fixed == 0
+        plain = np.stack((np.concatenate((i[first], j[second])), np.concatenate((j[first], i[second])),
+                          np.concatenate((rhs_ij[first], rhs_ji[second]))), axis=1).tolist()
+        for a, b, rhs in plain:
+            add_row(var_index=[1 + a, 1 + b], coefficient=[1, -1], lower_bound=-math.inf, upper_bound=rhs)
+        # t_i - t_j + M_ij x_ij <= M_ij - p_i - s_ij and t_j - t_i - M_ji x_ij <= -p_j - s_ji
+        mij, mji = M[fi, fj], M[fj, fi]
+        rows = np.stack((fi, fj, xindex, mij, mij + rhs_ij[free], mji, rhs_ji[free]), axis=1).tolist()
+        for a, b, xi, mij, rhs_ij, mji, rhs_ji in rows:
+            add_row(var_index=[1 + a, 1 + b, xi], coefficient=[1, -1, mij], lower_bound=-math.inf, upper_bound=rhs_ij)
+            add_row(var_index=[1 + b, 1 + a, xi], coefficient=[1, -1, -mji], lower_bound=-math.inf, upper_bound=rhs_ji)
+
+        error = self.solver.LoadModelFromProto(proto)
+        if error:
+            raise ValueError(error)
+        variables = self.solver.variables()
+        self.obj = variables[0]
+        self.t = variables[1:1 + nlot]
+        self.x = dict(zip(zip(fi.tolist(), fj.tolist()), variables[1 + nlot:]))
+
+    def add_hint(self, initial_schedule):
+        lots = self.lots
+        nlot = self.nlot
+
+        st = [initial_schedule[lot.idx] for lot in lots]
+        variables = list(self.t) + [self.obj]
+        values = st + [max(st[i] + lots[i].processt for i in range(nlot))]
+        for (i, j), x_ij in self.x.items():
+            variables.append(x_ij)
+            values.append(1 if st[i] < st[j] else 0)
+        self.solver.SetHint(variables, values)
+
+    def build_model(self, initial_schedule=None):
+        """initial_schedule: optional {lot idx: start time}, passed to the solver with SetHint.
+        Its makespan caps the horizon only when the schedule passes check_schedule."""
         # data
         lots = self.lots
         nlot = self.nlot
         solver = self.solver
-        horizon = cp.calculate_horizon(lots)  # upper bound of time variables
+        profile = self.profile
+        with profile.phase('bounds'):
+            upper_bound = None if initial_schedule is None else feasible_makespan(lots, self.ttmatrix, initial_schedule)
+            self.bounds = InstanceBounds(lots, self.ttmatrix, upper_bound=upper_bound)
+            horizon = self.bounds.horizon  # upper bound of time variables
+            lb, ub = self.bounds.start_lb(), self.bounds.start_ub()
+            self.lower_bound = lower_bound(lots, self.ttmatrix)
+        if self.preprocess:
+            with profile.phase('preprocess'):
+                self.fixings, self.preprocess_report = precedence_fixings(self.bounds)
+            print_report(self.preprocess_report)
 
-        # define variables
-        self.obj = solver.NumVar(0, horizon, 'obj')
-        self.t = [solver.NumVar(lot.arrivet, horizon, 't_%i' % lot.idx) for lot in lots]
-        self.x = [[solver.BoolVar('x_%i%i' % (i, j)) for j in range(nlot)] for i in range(nlot)]
+        if self.fast:
+            with profile.phase('model proto'):
+                self.load_model_proto()
+        else:
+            # define variables
+            with profile.phase('variables'):
+                self.obj = solver.NumVar(0, horizon, 'obj')
+                self.t = [solver.NumVar(lb[i], ub[i], 't_%i' % lots[i].idx) for i in range(nlot)]
+                self.x = {(i, j): solver.BoolVar('x_%i%i' % (i, j))
+                          for i in range(nlot) for j in range(i + 1, nlot) if (i, j) not in self.fixings}
 
-        # add constraints
-        cp.add_obj_constraints(solver, self.obj, self.t, lots)
-        self.add_precedence_constraint()
+            # add constraints
+            with profile.phase('objective'):
+                cp.add_obj_constraints(solver, self.obj, self.t, lots)
+            with profile.phase('setup'):
+                self.add_precedence_constraint()
+        if initial_schedule is not None:
+            with profile.phase('hint'):
+                self.add_hint(initial_schedule)
 
         # set objective function
         solver.Minimize(self.obj)
+        profile.counts['nvariables'] = solver.NumVariables()
+        profile.counts['nconstraints'] = solver.NumConstraints()
+
+    def show_build_profile(self):
+        self.profile.print_profile()
 
     def set_solve_time(self, t):
-        self.solver.SetTimeLimit(1000 * t)
+        self.solver.SetTimeLimit(int(1000 * t))
+
+    def set_num_workers(self, n):
+        self.solver.SetNumThreads(n)
+
+    def set_random_seed(self, seed):
+        self.solver.SetSolverSpecificParametersAsString('randomization/randomseedshift = %i' % seed)
 
     def solve(self):
         print('Start Solving...\n...')
@@ -94,11 +217,8 @@ class SingleSetupOrtoolsLP:
         solver = self.solver
         t = self.t
 
-        # save the result
-        for i in range(nlot):
-            lots[i].startt = t[i].solution_value()
-
-        self.objv = solver.Objective().Value()
+        # save the result, as exact integers in the solver's sequence
+        self.objv = repair_lots(lots, [t[i].solution_value() for i in range(nlot)], self.ttmatrix)
         # sort lots by sequence
         lots.sort(key=lambda lot: lot.startt)
 
@@ -113,10 +233,13 @@ class SingleSetupOrtoolsLP:
         print('\nAdvanced usage:')
         print('Problem solved in %f seconds' % (float(solver.wall_time()) / 1000.0))
         print('Problem solved in %d iterations' % solver.iterations())
+        print('Lower bound: %f' % self.get_lower_bound())
+        if self.has_solution():
+            print('Gap: %.2f%%' % (100 * self.get_gap()))
 
-    def show_gantt_chart(self):
+    def show_gantt_chart(self, path=None):
         if self.has_solution():
-            single_machine_setup_gantt(self.lots, self.ttmatrix)
+            single_machine_setup_gantt(self.lots, self.ttmatrix, path)
         else:
             print('No gantt chart to show!')
 
@@ -144,12 +267,20 @@ class SingleSetupOrtoolsLP:
     def get_objective_value(self):
         return self.objv
 
-    def main(self, solvetime=10):
+    def get_lower_bound(self):
+        if not self.has_solution():
+            return self.lower_bound
+        return max(self.lower_bound, self.solver.Objective().BestBound())
+
+    def get_gap(self):
+        return get_gap(self.objv, self.get_lower_bound())
+
+    def main(self, solvetime=10, gantt_file=None):
         self.build_model()
         self.set_solve_time(solvetime)
         self.solve()
         self.print_status_result_statistics()
-        self.show_gantt_chart()
+        self.show_gantt_chart(gantt_file)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+"""Disk cache of solve results keyed by a hash of the instance, the engine and the model parameters.
+
+    cache = SolutionCache('data/cache')
+    result = cached_solve(lots, ttmatrix, 'cp', time_limit=60, cache=cache)
+
+A cached OPTIMAL result is returned without solving. A cached FEASIBLE result is returned as well when
+it was found with at least the requested time limit; for a longer solve its schedule is the warm start
+of the new model. Entries are JSON files named by their key; the least recently used ones are removed
+once the directory grows above max_bytes.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from Lot import LotTable
+from engines import get_engine
+from lower_bound import get_gap
+
+MAX_BYTES = 256 * 2 ** 20
+WARM_START = ('cp', 'lp', 'copt')  # engines whose build_model takes an initial_schedule
+
+
+def instance_key(lots, ttmatrix, engine, params=None):
+    """sha256 of the lot columns in idx order, ttmatrix, engine and params. The time limit is not
+    part of the key, so longer solves find the entries of shorter ones."""
+    table = LotTable.from_lots(lots)
+    order = np.argsort(table.idx, kind='stable')
+    tt = np.ascontiguousarray(ttmatrix, dtype=np.int64)
+
+    h = hashlib.sha256()
+    for column in (table.idx[order], table.arrivet[order], table.processt[order], table.ltype[order]):
+        h.update(np.ascontiguousarray(column).tobytes())
+    h.update(np.array(tt.shape, dtype=np.int64).tobytes())
+    h.update(tt.tobytes())
+    h.update(json.dumps([engine, params or {}], sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class SolutionCache:
+
+    def __init__(self, cache_dir='data/cache', max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        """The entry of key or None; a hit counts as a use for the LRU order."""
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return entry
+
+    def put(self, key, entry):
+        """Store entry unless the cached one is better; keep the larger bound and time limit of both."""
+        old = self.get(key)
+        if old is not None:
+            if old['objv'] is not None and (entry['objv'] is None or old['objv'] < entry['objv'] or
+                                            (old['objv'] == entry['objv'] and old['status'] == 'OPTIMAL')):
+                entry = dict(old)
+            bounds = [b for b in (old['bound'], entry['bound']) if b is not None]
+            entry['bound'] = max(bounds) if bounds else None
+            entry['time_limit'] = max(old['time_limit'], entry['time_limit'])
+
+        tmp = self.path(key) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.path(key))
+        self.evict()
+        return entry
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                st = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((st.st_mtime_ns, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def apply_startt(lots, startt):
+    """Set startt, given in idx order, on lots."""
+    for lot, st in zip(sorted(lots, key=lambda lot: lot.idx), startt):
+        lot.startt = st
+
+
+def cached_solve(lots, ttmatrix, engine='cp', time_limit=10, cache=None, workers=None, params=None, extra=None):
+    """Solve through cache (None: always solve). params: constructor arguments of the engine, part of
+    the key; extra: constructor arguments that are not (the COPT envr). Return {'status', 'objv',
+    'bound', 'gap', 'time', 'startt' in idx order, 'cached'}; lots get the start times of the result."""
+    params = params or {}
+    key = instance_key(lots, ttmatrix, engine, params) if cache is not None else None
+    entry = cache.get(key) if cache is not None else None
+    if entry is not None and entry['startt'] is not None and \
+            (entry['status'] == 'OPTIMAL' or entry['time_limit'] >= time_limit):
+        apply_startt(lots, entry['startt'])
+        return dict(entry, gap=get_gap(entry['objv'], entry['bound']), time=0.0, cached=True)
+
+    mdl = get_engine(engine)(lots, ttmatrix, **params, **(extra or {}))
+    if entry is not None and entry['startt'] is not None and engine in WARM_START:
+        idx = sorted(lot.idx for lot in lots)
+        mdl.build_model(initial_schedule=dict(zip(idx, entry['startt'])))
+    else:
+        mdl.build_model()
+    mdl.set_solve_time(time_limit)
+    if workers is not None and hasattr(mdl, 'set_num_workers'):
+        mdl.set_num_workers(workers)
+    mdl.solve()
+
+    startt = None
+    if mdl.has_solution():
+        startt = [lot.startt for lot in sorted(lots, key=lambda lot: lot.idx)]
+    result = {'engine': engine, 'status': mdl.get_solve_status(), 'objv': mdl.get_objective_value(),
+              'bound': mdl.get_lower_bound(), 'time_limit': time_limit, 'startt': startt}
+    if cache is not None:
+        stored = cache.put(key, result)
+        if stored['objv'] is not None and (result['objv'] is None or stored['objv'] < result['objv']):
+            # the warm start was not improved within the time limit
+            apply_startt(lots, stored['startt'])
+        result = dict(stored)
+    return dict(result, gap=get_gap(result['objv'], result['bound']), time=mdl.get_solve_time(), cached=False)
@@ -0,0 +1,90 @@
+"""Objective-vs-time traces of a solve: one (time, objv, bound) row per incumbent, saved as columns in .npz.
+
+CP-SAT records every solution from a CpSolverSolutionCallback and COPT from a MIPSOL callback.
+pywraplp has no incumbent hook for SCIP, so its trace holds the final result only. Every trace ends
+with the final (time, objv, bound) of the solve, which carries the proven bound.
+"""
+import glob
+import os
+import time
+
+import numpy as np
+
+COLUMNS = ('time', 'objv', 'bound')
+
+
+class SolveTrace:
+
+    def __init__(self, engine='', instance=''):
+        self.engine = engine
+        self.instance = instance
+        self.rows = []
+        self.start = time.perf_counter()
+
+    def record(self, objv, bound, t=None):
+        if t is None:
+            t = time.perf_counter() - self.start
+        self.rows.append((t, objv, bound))
+
+    def as_array(self):
+        return np.array(self.rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+
+    def time_to_target(self, target):
+        """First time an incumbent reached objv <= target, None if none did."""
+        for t, objv, _ in self.rows:
+            if objv is not None and objv <= target:
+                return t
+        return None
+
+    def save(self, path):
+        data = self.as_array()
+        np.savez_compressed(path, engine=self.engine, instance=self.instance,
+                            **{name: data[:, k] for k, name in enumerate(COLUMNS)})
+
+
+def load_trace(path):
+    with np.load(path) as f:
+        trace = SolveTrace(str(f['engine']), str(f['instance']))
+        trace.rows = list(zip(*(f[name].tolist() for name in COLUMNS)))
+    return trace
+
+
+def load_traces(trace_dir):
+    """{file name without .npz: SolveTrace} of every trace in trace_dir."""
+    return {os.path.basename(path)[:-4]: load_trace(path)
+            for path in sorted(glob.glob(os.path.join(trace_dir, '*.npz')))}
+
+
+def cp_trace_callback(trace):
+    from ortools.sat.python import cp_model
+
+    class CpTraceCallback(cp_model.CpSolverSolutionCallback):
+        def on_solution_callback(self):
+            trace.record(self.ObjectiveValue(), self.BestObjectiveBound(), self.WallTime())
+
+    return CpTraceCallback()
+
+
+def copt_trace_callback(trace):
+    from coptpy import COPT, CallbackBase
+
+    class CoptTraceCallback(CallbackBase):
+        def callback(self):
+            if self.where() == COPT.CBCONTEXT_MIPSOL:
+                trace.record(self.getInfo(COPT.CBInfo.MipCandObj), self.getInfo(COPT.CBInfo.BestBnd))
+
+    return CoptTraceCallback()
+
+
+def traced_solve(mdl, engine, instance=''):
+    """Solve a built model of engine ('cp', 'lp', 'copt', 'heuristic') and return its SolveTrace."""
+    trace = SolveTrace(engine, instance)
+    if engine == 'cp':
+        mdl.solve(cp_trace_callback(trace))
+    elif engine == 'copt':
+        mdl.solve(copt_trace_callback(trace))
+    else:
+        mdl.solve()
+    if mdl.has_solution():
+        trace.record(mdl.get_objective_value(), mdl.get_lower_bound(), mdl.get_solve_time())
+    return trace
@@ -0,0 +1,67 @@
+"""Fix lot-pair precedences before the CP and MIP models are built.
+
+dominance  two lots of the same type and processing time are interchangeable: swapping them in any
+           schedule keeps it feasible with the same makespan, so the one released first (then the
+           lower position) can be put first.
+time       lot j cannot precede lot i when release_j + p_j + s_ji > latest start of i, which fixes i -> j.
+           s_ji is left out for models where setups only bind adjacent lots.
+
+fixings map a pair of lot positions (i, j), i < j, to the value of x_ij: 1 for i -> j, 0 for j -> i.
+"""
+import numpy as np
+
+from bounds import pairwise_setup
+
+
+def dominance_fixings(release, processt, ltype):
+    nlot = len(release)
+    pos = np.arange(nlot)
+    # groups of equal (type, processt) become contiguous runs, each run sorted by release and position
+    order = np.lexsort((pos, release, processt, ltype))
+    key = np.stack((ltype[order], processt[order]), axis=1)
+    cuts = np.flatnonzero(np.any(key[1:] != key[:-1], axis=1)) + 1
+
+    fixings = {}
+    for run in np.split(order, cuts):
+        run = run.tolist()
+        for a in range(len(run)):
+            for b in range(a + 1, len(run)):
+                first, second = run[a], run[b]
+                fixings[min(first, second), max(first, second)] = 1 if first < second else 0
+    return fixings
+
+
+def time_fixings(release, processt, ltype, ttmatrix, horizon, setups=True):
+    # before[i][j]: lot i can precede lot j within the horizon
+    latest = horizon - processt
+    earliest_end = release[:, None] + processt[:, None]
+    if setups:
+        earliest_end = earliest_end + pairwise_setup(ltype, ttmatrix)
+    before = earliest_end <= latest[None, :]
+    upper = np.triu(np.ones_like(before), k=1)
+    fixings = {}
+    for i, j in zip(*np.nonzero(upper & before & ~before.T)):
+        fixings[int(i), int(j)] = 1
+    for i, j in zip(*np.nonzero(upper & ~before & before.T)):
+        fixings[int(i), int(j)] = 0
+    return fixings
+
+
+def precedence_fixings(bounds, setups=True):
+    """Return (fixings, report) for the lots described by an InstanceBounds."""
+    dominance = dominance_fixings(bounds.release, bounds.processt, bounds.ltype)
+    timing = time_fixings(bounds.release, bounds.processt, bounds.ltype, bounds.ttmatrix, bounds.horizon, setups)
+    fixings = dict(timing)
+    fixings.update(dominance)
+
+    npair = bounds.nlot * (bounds.nlot - 1) // 2
+    report = {'pairs': npair,
+              'dominance': len(dominance),
+              'time': len(timing),
+              'removed': len(fixings)}
+    return fixings, report
+
+
+def print_report(report):
+    print('Preprocessing fixed %i of %i precedence variables (%i dominance, %i time window)' %
+          (report['removed'], report['pairs'], report['dominance'], report['time']))